@@ -5,33 +5,48 @@ All the output are the variables of the software (matrix video, analysis paramet
 """
 
 
+import os
 import numpy as np
 from openpyxl import load_workbook
-from scipy.signal import argrelextrema
 from skimage.filters import gaussian
 
 import SaveReadMatrix
-import MultiLoadCzi5D
+import RawDataCache
 import UsefulWidgets
+import FrameSource
+import ZSlab
 
 
 class RawDataLoader:
-    """This class loads raw data and shapes them accordingly to the analysis done."""
-    def __init__(self, analysis_folder, fnames):
+    """This class loads raw data and shapes them accordingly to the analysis done.
 
-        raw_data     =  MultiLoadCzi5D.MultiLoadCzi5D(fnames, np.load(analysis_folder + '/nucs_spots_channels.npy'))
-        im_red_smpl  =  np.load(analysis_folder + '/im_red_smpl.npy')
-        jj_start     =  np.where(np.sum(raw_data.imarray_red - im_red_smpl[0], axis=(1, 2)) == 0)[0][0]
-        jj_end       =  np.where(np.sum(raw_data.imarray_red - im_red_smpl[1], axis=(1, 2)) == 0)[0][0]
+    When the analysis stored the analyzed frame range, only those frames are
+    decoded; otherwise the range is found comparing the whole series with the
+    stored first and last frames.
+    """
+    def __init__(self, analysis_folder, fnames):
 
-        self.imarray_green    =  raw_data.imarray_green[jj_start:jj_end + 1]
-        self.imarray_red      =  raw_data.imarray_red[jj_start:jj_end + 1]
-        self.green4d          =  raw_data.green4d[jj_start:jj_end + 1]
-        self.red4d            =  raw_data.red4d[jj_start:jj_end + 1]
-        self.pix_size_x       =  raw_data.pix_size_x
-        self.pix_size_z       =  raw_data.pix_size_z
-        self.time_step_value  =  raw_data.time_step_value
-        self.fnames           =  fnames
+        nucs_spts_ch  =  np.load(analysis_folder + '/nucs_spots_channels.npy')
+        if os.path.isfile(analysis_folder + '/first_last_frame.npy'):
+            raw_data  =  RawDataCache.RawDataCache(fnames, nucs_spts_ch, frame_range=np.load(analysis_folder + '/first_last_frame.npy'))
+            jj_start  =  0
+            jj_end    =  raw_data.time_steps - 1
+        else:
+            raw_data     =  RawDataCache.RawDataCache(fnames, nucs_spts_ch)
+            im_red_smpl  =  np.load(analysis_folder + '/im_red_smpl.npy')
+            jj_start     =  np.where(np.sum(raw_data.imarray_red - im_red_smpl[0], axis=(1, 2)) == 0)[0][0]
+            jj_end       =  np.where(np.sum(raw_data.imarray_red - im_red_smpl[1], axis=(1, 2)) == 0)[0][0]
+
+        self.imarray_green     =  raw_data.imarray_green[jj_start:jj_end + 1]
+        self.imarray_red       =  raw_data.imarray_red[jj_start:jj_end + 1]
+        self.green4d           =  raw_data.green4d[jj_start:jj_end + 1]
+        self.red4d             =  raw_data.red4d[jj_start:jj_end + 1]
+        self.z_profile         =  raw_data.z_profile[jj_start:jj_end + 1]
+        self.first_last_frame  =  raw_data.first_last_frame[0] + np.array([jj_start, jj_end + 1])
+        self.pix_size_x        =  raw_data.pix_size_x
+        self.pix_size_z        =  raw_data.pix_size_z
+        self.time_step_value   =  raw_data.time_step_value
+        self.fnames            =  fnames
 
 
 class SpotsIntsVol:
@@ -59,8 +74,12 @@ class AnalysisParameters:
 
 
 class NucleiSegmented:
-    """Load nuclei segmented results."""
-    def __init__(self, analysis_folder, green4d):
+    """Load nuclei segmented results.
+
+    The z planes of each frame come from ZSlab, the same of NucleiDetector:
+    with the z profile stored while loading raw data only those planes are read.
+    """
+    def __init__(self, analysis_folder, green4d, z_profile=None):
 
         nucs_lbld  =  np.load(analysis_folder + '/nuclei_segmented.npy')
 
@@ -68,22 +87,15 @@ class NucleiSegmented:
         pbar.show()
         pbar.update_progressbar(0)
 
+        tlen        =  nucs_lbld.shape[0]
+        green4d     =  green4d[:tlen]
+        z_slab      =  ZSlab.ZSlab(ZSlab.z_profile(green4d) if z_profile is None else z_profile[:tlen])     # planes to work on, frame by frame
         green_minp  =  np.zeros(nucs_lbld.shape, dtype=green4d.dtype)                                    # initialize the image-matrix for the intensity projection (sum in z)
-        mxxs        =  []
-        for tt in range(nucs_lbld.shape[0]):                                                                                          # for each time step
+        for tt, green_zxy, _ in FrameSource.FrameSource(green4d, prefetch=True, z_range=z_slab.slabs):                                  # for each time step
             pbar.update_progressbar(tt + 1)
-            z_prof          =  np.sum(green4d[tt], axis=(1, 2))
-            mxx             =  argrelextrema(z_prof, np.greater)[0]
-            if mxx.size == 2:
-                mxxs.append(mxx)
-                green_bff       =  gaussian(green4d[tt, mxx[0]:mxx[1]].astype(np.float32), 1.5)                                            # gaussian smoothing
-                green_minp[tt]  =  green_bff.sum(0)                                                                         # sum over z
-
-        mxxs      =  np.asarray(mxxs)
-        z_ref     =  mxxs.mean(0)
-        z_ref[0]  =  np.round(z_ref[0])
-        z_ref[1]  =  np.round(z_ref[1])
+            green_bff       =  gaussian(green_zxy.astype(np.float32), 1.5)                                                            # gaussian smoothing
+            green_minp[tt]  =  green_bff.sum(0)                                                                         # sum over z
 
         self.nucs_lbld   =  nucs_lbld
         self.green_minp  =  green_minp
-        self.z_ref       =  z_ref.astype(int)
+        self.z_ref       =  z_slab.z_ref
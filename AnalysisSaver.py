@@ -1,6 +1,8 @@
 """This function saves the results of the analysis.
 
 Input are the folder name and all the matrices geenrated. No output.
+The track table of the nuclei is saved next to nuclei_tracked.npy (built from
+the tracked nuclei when not given).
 """
 
 import os
@@ -12,11 +14,12 @@ from skimage.measure import regionprops_table
 import pyqtgraph as pg
 
 import SaveReadMatrix
+import TrackTable
 
 class AnalysisSaver:
     """Only class, does all the job."""
     def __init__(self, folder2write, raw_data, nucs_spots_channels, spots_3d, spots_tracked, nuclei_tracked, nuclei_segmented, features_3d, nuc_active,
-                 cages_tli, fnames, gauss_kernelsize_value, spots_thr_value, volume_thr_value, dist_thr_value, max_dist, soft_version):
+                 cages_tli, fnames, gauss_kernelsize_value, spots_thr_value, volume_thr_value, dist_thr_value, max_dist, soft_version, track_table=None):
 
         os.mkdir(folder2write)
         tifffile.imwrite(str(folder2write) + "/false_2colors.tiff", nuc_active.nuclei_active3c.astype("uint16"))
@@ -28,15 +31,19 @@ class AnalysisSaver:
         SaveReadMatrix.SpotsMatrixSaver2D(spots_tracked, folder2write, '/spots_trck.npy')
         np.save(folder2write + '/nuclei_segmented.npy', nuclei_segmented.nucs_lbld.astype("uint16"))
         np.save(folder2write + '/nuclei_tracked.npy', nuclei_tracked.astype("uint16"))
+        if track_table is None:
+            track_table  =  TrackTable.from_movie(nuclei_tracked, nuclei_segmented.nucs_lbld)
+        track_table.save(folder2write)
         np.save(folder2write + '/cages_tli.npy', cages_tli)
 
         im_red_smpl     =  np.zeros(((2,) + raw_data.imarray_red.shape[1:]), dtype=raw_data.imarray_red.dtype)
         im_red_smpl[0]  =  raw_data.imarray_red[0]
         im_red_smpl[1]  =  raw_data.imarray_red[-1]
         np.save(folder2write + '/im_red_smpl.npy', im_red_smpl)
+        np.save(folder2write + '/first_last_frame.npy', raw_data.first_last_frame)
         np.save(folder2write + '/spots_features3d.npy', features_3d.statistics_info.astype(float))
 
-        idx         =  np.unique(nuclei_tracked[nuclei_tracked != 0])
+        idx         =  track_table.track_ids
         spots_ints  =  np.zeros((idx.size, raw_data.imarray_green.shape[0]))
         spots_vols  =  np.zeros((idx.size, raw_data.imarray_green.shape[0]))
         for cnt, k in enumerate(idx):
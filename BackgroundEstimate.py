@@ -9,6 +9,8 @@ from skimage.measure import regionprops_table
 from skimage.segmentation import expand_labels
 
 import UsefulWidgets
+import FrameSource
+import LabelsRemap
 
 
 def reconstruct_spots_sing_t(spots_3d_coords, zlen, xlen, ylen, t):
@@ -33,12 +35,12 @@ class BackgroundEstimate:
         pbar.show()
 
         t_lbl_avints            =  []                                                                                   # initialize a list to store final info
-        for tt in range(tlen):                                                                                          # for each time frame
+        for tt, green_zxy, _ in FrameSource.FrameSource(green4d, prefetch=True):                                        # for each time frame
             pbar.update_progressbar(tt)
             spots_3d_singtime   =  reconstruct_spots_sing_t(spots_3d_coords, zlen, xlen, ylen, tt)                      # reconstruct the 3D time point with coordinates
             spots_3d_singtime  *=  spots_tracked[tt].astype(np.uint16)                                                  # multiply to properly label in 3D
             cages               =  expand_labels(spots_3d_singtime, 5) - expand_labels(spots_3d_singtime, 3)            # build the cages: use expand label twice with different iterations and subtract to have the shells surrounding the spots
-            rgp_cages           =  regionprops_table(cages, green4d[tt], properties=["label", "intensity_image", "area"])   # regionprops to measure volume and intensity and store the label
+            rgp_cages           =  regionprops_table(cages, green_zxy, properties=["label", "intensity_image", "area"])     # regionprops to measure volume and intensity and store the label
             for cnt, ll in enumerate(rgp_cages["label"]):
                 t_lbl_avints.append([tt, ll, np.sum(rgp_cages["intensity_image"][cnt] / rgp_cages["area"][cnt])])       # time, label, tot intensity and volume are stored in the list
 
@@ -56,12 +58,9 @@ class BackgroundEstimateFillingGaps:
 
         tlen, zlen, xlen, ylen  =  green4d.shape                                                                        # read matrix shape
 
-        spts_tags  =  np.unique(spots_tracked[spots_tracked != 0])                                                      # tags list of all the spots
-        for spt_tag in spts_tags:                                                                                       # for each tag
-            # print(spt_tag)
-            sing_spt  =  spots_tracked == spt_tag                                                                       # isolate the spot
-            if (np.sum(np.sign(np.sum(sing_spt, axis=(1, 2)))) / tlen) < 0.2:                                           # check if it is present in less than the 20% of the frames (20 is very arbitrary)
-                spots_tracked  *=  (1 - sing_spt).astype(np.uint32)                                                     # if it is the case, remove the spot
+        n_frames  =  LabelsRemap.frames_count(spots_tracked)                                                           # number of frames in which each spot is present
+        shorts    =  np.where((n_frames / tlen) < 0.2)[0]                                                             # spots present in less than the 20% of the frames (20 is very arbitrary)
+        LabelsRemap.remap(spots_tracked, LabelsRemap.drop_lut(spots_tracked.max(), shorts, spots_tracked.dtype), out=spots_tracked)      # are removed, in place
 
         spts_tags  =  np.unique(spots_tracked[spots_tracked != 0])                                                      # re-extract the list of tag for the survived spots
 
@@ -70,12 +69,12 @@ class BackgroundEstimateFillingGaps:
         pbar.show()
 
         t_lbl_avints            =  []                                                                                                        # initialize a list to store final info
-        for tt in range(tlen):                                                                                                               # for each time frame
+        for tt, green_zxy, _ in FrameSource.FrameSource(green4d, prefetch=True):                                                             # for each time frame
             pbar.update_progressbar(tt)
             spots_3d_singtime   =  reconstruct_spots_sing_t(spots_3d_coords, zlen, xlen, ylen, tt)                                           # reconstruct the 3D time point with coordinates
             spots_3d_singtime  *=  spots_tracked[tt].astype(np.uint16)                                                                       # multiply to properly label in 3D
             cages               =  expand_labels(spots_3d_singtime, 5) - expand_labels(spots_3d_singtime, 3)            # build the cages: use expand label twice with different iterations and subtract to have the shells surrounding the spots
-            rgp_cages           =  regionprops_table(cages, green4d[tt], properties=["label", "intensity_image", "area"])                    # regionprops to measure volume and intensity and store the label
+            rgp_cages           =  regionprops_table(cages, green_zxy, properties=["label", "intensity_image", "area"])                      # regionprops to measure volume and intensity and store the label
             for cnt, ll in enumerate(rgp_cages["label"]):
                 t_lbl_avints.append([tt, ll, np.sum(rgp_cages["intensity_image"][cnt] / rgp_cages["area"][cnt])])                             # time, label, tot intensity and volume are stored in the list
 
@@ -0,0 +1,70 @@
+"""This function reads the metadata of a .czi file without touching pixel data.
+
+The XML metadata are parsed once; output are the pixel sizes (in µm), the
+full vector of timestamps, the time step, channel names, dimensions and
+dtype. Results are cached by file path, size and modification time, so
+inspecting many files (or the same file several times) is fast.
+Pixel sizes and timestamps are None when not found in the file.
+"""
+
+
+import os
+import xml.etree.ElementTree as ET
+import numpy as np
+from czifile import CziFile
+
+import LoadCzi5D
+
+
+METADATA_CACHE  =  {}
+
+
+def find_float(root, path):
+    """Float value of the first element matching path, None if absent."""
+    el  =  root.find(path)
+    if el is None or el.text is None:
+        return None
+    return float(el.text)
+
+
+class CziMetadata:
+    """Only class, does all the job."""
+    def __init__(self, fname):
+
+        fstat  =  os.stat(fname)
+        key    =  (os.path.abspath(fname), fstat.st_size, fstat.st_mtime_ns)
+        if key not in METADATA_CACHE:
+            METADATA_CACHE[key]  =  self.read(str(fname))
+        self.__dict__.update(METADATA_CACHE[key])
+
+    @staticmethod
+    def read(fname):
+        """Read header, subblock directory, XML and timestamps of the file."""
+        with CziFile(fname) as czi:
+            dims        =  LoadCzi5D.czi_dims(czi)
+            dtype       =  czi.dtype
+            root        =  ET.fromstring(czi.metadata())
+            timestamps  =  None
+            for attachment in czi.attachments():
+                if attachment.attachment_entry.name == 'TimeStamps':
+                    timestamps  =  np.asarray(attachment.data())
+                    break
+
+        scale_x  =  find_float(root, ".//ScalingX")                                                    # in meters: old style metadata first, then the Distance items
+        scale_z  =  find_float(root, ".//ScalingZ")
+        if scale_z is None:
+            scale_x  =  find_float(root, ".//Distance[@Id='X']/Value")
+            scale_z  =  find_float(root, ".//Distance[@Id='Z']/Value")
+
+        channels  =  root.find(".//Information/Image/Dimensions/Channels")
+        if channels is None:
+            channels  =  root.find(".//Channels")
+        channel_names  =  [] if channels is None else [ch.get("Name", ch.get("Id", "")) for ch in channels.findall("Channel")]
+
+        return {"dims":             dims,
+                "dtype":            np.dtype(dtype),
+                "pix_size_x":       None if scale_x is None else np.round(scale_x * 1000000, 4),
+                "pix_size_z":       None if scale_z is None else np.round(scale_z * 1000000, 4),
+                "timestamps":       timestamps,
+                "time_step_value":  None if timestamps is None or timestamps.size < 2 else np.round(timestamps[1] - timestamps[0], 2),
+                "channel_names":    channel_names}
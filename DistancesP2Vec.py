@@ -1,7 +1,24 @@
 """This function calculates the distance between a point (x0 = (x0_1, x0_2))
-and a vector (vec, such that vec,shape = (2, n))"""
+and a vector (vec, such that vec,shape = (2, n)).
+
+close_pairs gives in one call the pairs of points of two sets closer than a
+maximum distance, searched with a kd-tree.
+"""
 
 import numpy as np
+from scipy.spatial import cKDTree
+
+
+def close_pairs(pts1, pts2, dist_max):
+    """Pairs of points of pts1 (N1x2) and pts2 (N2x2) closer than dist_max (strictly).
+
+    Output are the indexes in pts1, the indexes in pts2 and the distances of the pairs.
+    """
+    if len(pts1) == 0 or len(pts2) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    pairs  =  cKDTree(pts1).sparse_distance_matrix(cKDTree(pts2), dist_max, output_type="ndarray")
+    pairs  =  pairs[pairs["v"] < dist_max]
+    return pairs["i"].astype(np.int64), pairs["j"].astype(np.int64), pairs["v"]
 
 
 class DistancesP2Vec:
@@ -10,11 +27,7 @@ class DistancesP2Vec:
         self.x0   =  x0
         self.vec  =  vec
 
-        dists       =  np.zeros(vec[0, :].size)
-        dists_sqrt  =  np.zeros(vec[0, :].size)
-        for i in range(dists.size):
-            dists[i]       =  (x0[0] - vec[0, i]) ** 2 + (x0[1] - vec[1, i]) ** 2
-            dists_sqrt[i]  =  np.sqrt(dists[i])
+        dists  =  ((np.asarray(vec, dtype=np.float64) - np.reshape(x0, (2, 1))) ** 2).sum(0)
 
         self.dists       =  dists
-        self.dists_sqrt  =  dists_sqrt
\ No newline at end of file
+        self.dists_sqrt  =  np.sqrt(dists)
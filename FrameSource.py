@@ -0,0 +1,58 @@
+"""This function streams raw data one time frame at a time.
+
+Given the green and red 4D matrices (numpy matrices, memory maps of the raw
+data cache or LazyCzi4D objects; a channel can be None), iterating over it
+yields (t, green_zxy, red_zxy) for each time frame. With lazy matrices only
+one frame is decoded at a time, so long series are processed in a bounded
+amount of memory. With prefetch=True the next frame is read by a background
+thread while the current one is being processed (memory maps and lazy
+matrices only, matrices already in memory are just sliced). z_range = [first, last)
+restricts the frames to a window of z planes; a Tx2 matrix of z ranges gives
+a different window to each frame.
+"""
+
+
+from multiprocessing.pool import ThreadPool
+import numpy as np
+
+
+class FrameSource:
+    """Iterable over the time frames of the raw data."""
+    def __init__(self, green4d, red4d=None, prefetch=False, z_range=None):
+
+        self.green4d   =  green4d
+        self.red4d     =  red4d
+        self.prefetch  =  prefetch and any(mtx is not None and type(mtx) is not np.ndarray for mtx in [green4d, red4d])    # matrices already in memory have nothing to prefetch
+        self.tlen      =  len(green4d) if green4d is not None else len(red4d)
+        if z_range is None:
+            self.z_slices  =  [slice(None)] * self.tlen
+        elif np.ndim(z_range) == 2:                                                                 # a z range for each frame
+            self.z_slices  =  [slice(z0, z1) for z0, z1 in z_range]
+        else:
+            self.z_slices  =  [slice(z_range[0], z_range[1])] * self.tlen
+
+    def __len__(self):
+        return self.tlen
+
+    def read_frame(self, t):
+        """Read the time frame t of both channels (a copy when prefetching, so the reading really happens in the thread)."""
+        read    =  np.array if self.prefetch else np.asarray
+        frames  =  [None if mtx is None else read(mtx[t, self.z_slices[t]]) for mtx in [self.green4d, self.red4d]]
+        return t, frames[0], frames[1]
+
+    def __iter__(self):
+        if not self.prefetch or self.tlen == 0:
+            for t in range(self.tlen):
+                yield self.read_frame(t)
+            return
+
+        pool  =  ThreadPool(1)
+        try:
+            next_frame  =  pool.apply_async(self.read_frame, (0,))
+            for t in range(self.tlen):
+                frame  =  next_frame.get()
+                if t + 1 < self.tlen:                                                       # start reading the next frame while the current one is used
+                    next_frame  =  pool.apply_async(self.read_frame, (t + 1,))
+                yield frame
+        finally:
+            pool.terminate()
@@ -4,7 +4,7 @@ It starts from a matrix-image with labeled connected objects and cuts or merges
 labels depending on the array_region and end_pts. Array_region is the vector
 with the values of the pixels above the segment in the matrix-image. end_pts are
 the coordinate of the extremal point of the segment. The out put is the updated
-version of the labels_img.
+version of the labels_img. Merges are done with a lookup table (LabelsRemap).
 """
 
 
@@ -12,6 +12,7 @@ import numpy as np
 import skimage.morphology as skmr
 
 import BresenhamLine
+import LabelsRemap
 
 
 class LabelsModify:
@@ -40,12 +41,7 @@ class LabelsModify:
 
         else:
 
-            labels_mask  =  np.zeros(self.labels_img.shape)
-
-            for l in idxs:
-                labels_mask  +=  (self.labels_img == l).astype(np.int32)                                                  # finds the mask with all the involved speckles
-
-            labels_fin  =  self.labels_img * (1 - labels_mask) + idxs[0] * labels_mask                                  # assigns one single label to them
+            labels_fin  =  LabelsRemap.remap(self.labels_img, LabelsRemap.merge_lut(self.labels_img.max(), [idxs]))     # assigns one single label to all the involved speckles
 
         self.labels_fin     =  labels_fin
 
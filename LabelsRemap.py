@@ -0,0 +1,72 @@
+"""This function relabels matrices of labels through lookup tables.
+
+A lookup table (lut) gives the new tag of each tag, lut[0] = 0: remap applies
+it to a label matrix of any integer dtype (a frame or a time series of frames)
+chunk by chunk along the first axis, so temporary matrices stay chunk sized; the
+result can be written in place. Float label stacks (tags stored as floats)
+are read as integer tags.
+drop_lut and merge_lut build the tables to remove tags or to join groups of tags
+into one, frames_count counts the frames in which each tag is present.
+"""
+
+
+import numpy as np
+
+
+def as_tags(lbls):
+    """Label matrix as integer tags (float label matrices are cast, integer ones are left as they are)."""
+    lbls  =  np.asarray(lbls)
+    return lbls if np.issubdtype(lbls.dtype, np.integer) else lbls.astype(np.int64)
+
+
+def identity_lut(lbls_max, dtype=np.int64):
+    """Lookup table leaving all the tags as they are."""
+    return np.arange(int(lbls_max) + 1, dtype=dtype)
+
+
+def drop_lut(lbls_max, ids, dtype=np.int64):
+    """Lookup table removing the tags in ids (the ones above lbls_max are ignored)."""
+    lut                        =  identity_lut(lbls_max, dtype)
+    ids                        =  as_tags(ids).ravel()
+    lut[ids[ids <= lbls_max]]  =  0
+    return lut
+
+
+def merge_lut(lbls_max, groups, dtype=np.int64):
+    """Lookup table joining each group of tags (list of tags) into its first tag."""
+    lut  =  identity_lut(lbls_max, dtype)
+    for group in groups:
+        group       =  as_tags(group).ravel()
+        lut[group]  =  group[0]
+    return lut
+
+
+def remap(lbls, lut, out=None, chunk=None):
+    """Relabel lbls with lut, chunk by chunk along the first axis.
+
+    out is the output matrix (it can be lbls itself, for an in place relabel);
+    by default it is a new matrix with the dtype of lut. chunk is the number of
+    elements of the first axis remapped at once (by default about 16M pixels).
+    """
+    lut  =  np.asarray(lut)
+    if out is None:
+        out  =  np.empty(lbls.shape, dtype=lut.dtype)
+    if lbls.ndim == 0 or lbls.shape[0] == 0:
+        out[...]  =  lut[as_tags(lbls)]
+        return out
+
+    if chunk is None:
+        chunk  =  max(1, 2 ** 24 // max(1, lbls[0].size))
+    for k in range(0, lbls.shape[0], chunk):
+        out[k:k + chunk]  =  lut[as_tags(lbls[k:k + chunk])]
+    return out
+
+
+def frames_count(lbls, lbls_max=None):
+    """Number of frames (first axis) in which each tag is present (array indexed by tag)."""
+    if lbls_max is None:
+        lbls_max  =  lbls.max(initial=0)
+    counts  =  np.zeros(int(lbls_max) + 1, dtype=np.int64)
+    for frame in lbls:
+        counts[np.unique(as_tags(frame))]  +=  1
+    return counts
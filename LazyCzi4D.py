@@ -0,0 +1,115 @@
+"""This function gives a lazy 4D (t, z, x, y) matrix backed by .czi files.
+
+The subblock directory of each file is indexed once; then only the (t, z)
+planes actually requested are decoded. Indexing the time dimension with a
+slice gives a new lazy matrix, indexing with an integer gives the decoded
+3D (or 2D) numpy matrix of that frame. Planes are given in the same
+orientation (ImageJ conform) of the matrices of MultiLoadCzi5D.
+Inputs are the (natsorted) filenames, the channel number and optionally a
+window of z planes z_range = [first, last).
+"""
+
+
+import copy
+import threading
+import numpy as np
+from czifile import CziFile
+
+import LoadCzi5D
+
+
+class LazyCzi4D:
+    """Lazy matrix: behaves like a (t, z, x, y) numpy matrix for indexing over time."""
+    def __init__(self, fnames, channel, z_range=None):
+
+        planes   =  {}                                                                      # (t, z) of the series: list of the subblocks (file, directory position, x and y offsets)
+        t_start  =  0
+        for f_idx, fname in enumerate(fnames):
+            with CziFile(str(fname)) as czi:
+                c, t_len, zlen, xlen, ylen  =  LoadCzi5D.czi_dims(czi)
+                dtype                       =  czi.dtype
+                z_first, z_last             =  (0, zlen) if z_range is None else (max(z_range[0], 0), min(z_range[1], zlen))
+                for c, t, z, x0, y0, idx in LoadCzi5D.planes_index(czi).tolist():
+                    if c == channel and z_first <= z < z_last:
+                        planes.setdefault((t_start + t, z - z_first), []).append((f_idx, idx, x0, y0))
+            t_start  +=  t_len
+
+        self.fnames  =  [str(fname) for fname in fnames]
+        self.planes  =  planes
+        self.frames  =  np.arange(t_start)                                                  # frames of the series this matrix refers to
+        self.dtype   =  np.dtype(dtype)
+        self.shape   =  (t_start, z_last - z_first, ylen, xlen)                             # x and y are swapped by the ImageJ orientation
+        self.ndim    =  4
+        self.czis    =  {}                                                                  # opened files, filled on demand
+        self.lock    =  threading.Lock()                                                    # opened files are shared: one reading at a time (frames can be prefetched by a thread)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getstate__(self):
+        """Opened files are not sent to other processes: they will be opened again there."""
+        state          =  self.__dict__.copy()
+        state["czis"]  =  {}
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock  =  threading.Lock()
+
+    def __array__(self, dtype=None, copy=None):
+        """Decode all the frames into a numpy matrix."""
+        out  =  np.zeros(self.shape, dtype=self.dtype)
+        for t in range(self.shape[0]):
+            out[t]  =  self[t]
+        return out if dtype is None else out.astype(dtype)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key  =  (key,)
+        if len(key) == 0 or Ellipsis in key:
+            return np.asarray(self)[key]
+
+        t_key, rest  =  key[0], key[1:]
+        if isinstance(t_key, slice):
+            sub         =  copy.copy(self)                                                  # new lazy matrix on a subset of frames (it shares the opened files)
+            sub.frames  =  self.frames[t_key]
+            sub.shape   =  (sub.frames.size,) + self.shape[1:]
+            if all(kk == slice(None) for kk in rest):
+                return sub
+            if sub.shape[0] == 0:
+                return np.asarray(sub)[(slice(None),) + rest]
+            return np.stack([sub[(t,) + rest] for t in range(sub.shape[0])])                # frame by frame, to decode only the requested planes
+
+        if isinstance(t_key, (int, np.integer)):
+            frame  =  self.read_frame(self.frames[t_key], rest[0] if rest else slice(None))
+            if frame.ndim == 2:                                                             # a single z plane was requested
+                return frame[rest[1:]]
+            return frame[(slice(None),) + rest[1:]]
+
+        return np.asarray(self)[key]
+
+    def czi(self, f_idx):
+        """Opened file, opening it the first time."""
+        if f_idx not in self.czis:
+            self.czis[f_idx]  =  CziFile(self.fnames[f_idx])
+        return self.czis[f_idx]
+
+    def read_frame(self, t, z_key=slice(None)):
+        """Decode the planes z_key of the time frame t of the series."""
+        zs   =  np.arange(self.shape[1])[z_key]
+        out  =  np.zeros((np.size(zs),) + self.shape[2:], dtype=self.dtype)
+        for cnt, z in enumerate(np.atleast_1d(zs)):
+            for f_idx, idx, x0, y0 in self.planes.get((t, z), []):
+                with self.lock:
+                    tile  =  self.czi(f_idx).filtered_subblock_directory[idx].data_segment().data()
+                tile  =  tile.reshape(tile.shape[-3:-1])
+                out[cnt, y0:y0 + tile.shape[1], x0:x0 + tile.shape[0]]  =  tile.T            # transposition gives the ImageJ orientation
+        return out[0] if np.ndim(zs) == 0 else out
+
+    def close(self):
+        """Close all the opened files."""
+        with self.lock:
+            for czi in self.czis.values():
+                czi.close()
+            self.czis  =  {}
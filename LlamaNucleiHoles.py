@@ -32,6 +32,8 @@ import BackgroundEstimate
 import AnalysisLoader
 import SpatiallySelectedSaver
 import CheckIntensityAroundSpots
+import RawDataCache
+import TrackTable
 
 
 class MainWindow(QtWidgets.QMainWindow):
@@ -331,6 +333,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self.busy_lbl            =  busy_lbl
         self.pixsize_z_lbl       =  pixsize_z_lbl
         self.pixsize_x_lbl       =  pixsize_x_lbl
+        self.segm_cache          =  {}                                                             # per frame nuclei segmentation of the last run of NucleiDetector (a copy of its results)
+        self.segm_keys           =  []                                                             # cache keys of the frames of the last run
 
         self.setGeometry(800, 100, 1200, 800)
         self.setWindowTitle(self.software_version)
@@ -411,6 +415,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self.raw_data.imarray_green  =  self.raw_data.imarray_green[self.mpp2.first_last_frame[0]:self.mpp2.first_last_frame[1]]
         self.raw_data.green4d        =  self.raw_data.green4d[self.mpp2.first_last_frame[0]:self.mpp2.first_last_frame[1]]
         self.raw_data.red4d          =  self.raw_data.red4d[self.mpp2.first_last_frame[0]:self.mpp2.first_last_frame[1]]
+        self.raw_data.z_profile      =  self.raw_data.z_profile[self.mpp2.first_last_frame[0]:self.mpp2.first_last_frame[1]]
+        self.raw_data.first_last_frame  =  self.raw_data.first_last_frame[0] + self.mpp2.first_last_frame      # frame range in the whole series, stored with the analysis
         self.frame_nucs_raw.setImage(self.raw_data.imarray_red)
         self.frame_spts_raw.setImage(self.raw_data.imarray_green)
         self.mpp2.close()
@@ -463,6 +469,8 @@ class MainWindow(QtWidgets.QMainWindow):
 
             self.nucs_spots_channels  =  SetChannels.getChannels() - 1
             self.raw_data             =  MultiLoadCzi5D.MultiLoadCzi5D(self.fnames, self.nucs_spots_channels)
+            self.segm_cache.clear()                                                                     # segmentations of the previous data are not needed anymore
+            self.segm_keys  =  []
             # self.first_last_frame     =  [0, self.raw_data.imarray_red.shape[0]]
             self.frame_nucs_raw.setImage(self.raw_data.imarray_red)
             self.frame_spts_raw.setImage(self.raw_data.imarray_green)
@@ -483,7 +491,8 @@ class MainWindow(QtWidgets.QMainWindow):
         QtWidgets.QApplication.processEvents()
 
         # try:
-        self.nuclei_segmented  =  NucleiDetector.NucleiDetector(self.raw_data.green4d)
+        self.nuclei_segmented  =  NucleiDetector.NucleiDetector(self.raw_data.green4d, n_workers=None, cache=self.segm_cache, z_profile=self.raw_data.z_profile)    # only frames not yet segmented (or modified) are computed
+        self.segm_keys         =  self.nuclei_segmented.frame_keys
 
         # except Exception:
         #     traceback.print_exc()
@@ -496,6 +505,8 @@ class MainWindow(QtWidgets.QMainWindow):
     def sgnl_update_cycle(self):
         """Update changes done in the modify manual tool."""
         self.nuclei_segmented.nucs_lbld  =  self.mpp1.nuclei_seg
+        NucleiDetector.invalidate(self.segm_cache, self.segm_keys, self.mpp1.modified_frames)          # manually corrected frames will be segmented again at the next run
+        self.mpp1.modified_frames.clear()
         self.frame_nucs_sgm.setImage(self.nuclei_segmented.nucs_lbld)
         self.mycmap  =  pg.ColorMap(np.linspace(0, 1, self.nuclei_segmented.nucs_lbld.max()), color=self.colors4map)
         self.frame_nucs_sgm.setColorMap(self.mycmap)
@@ -517,8 +528,10 @@ class MainWindow(QtWidgets.QMainWindow):
 
         try:
             self.px_brd          =  3
-            nuclei_tracked       =  NucleiConnectMultiCore.NucleiConnectMultiCore(self.nuclei_segmented.nucs_lbld, self.dist_thr_value).nuclei_tracked
-            self.nuclei_tracked  =  RemoveBadNuclei.RemoveBorderNuclei(nuclei_tracked, self.px_brd).nuclei_tracked
+            bffr                 =  NucleiConnectMultiCore.NucleiConnectMultiCore(self.nuclei_segmented.nucs_lbld, self.dist_thr_value)
+            bffr                 =  RemoveBadNuclei.RemoveBorderNuclei(bffr.nuclei_tracked, self.px_brd, bffr.track_table)
+            self.nuclei_tracked  =  bffr.nuclei_tracked
+            self.track_table     =  bffr.track_table
             self.popup_nuclei_trackeded()
 
         except Exception:
@@ -558,7 +571,7 @@ class MainWindow(QtWidgets.QMainWindow):
             self.ipp_3d_av         =  ipp_3d.sum() / float(self.spots_3d.spots_vol.sum())                                                               # ipp is defined just to calculate the average intensity value of the spots, ipp_av
             self.features_3d       =  ParametersExtraction.ParametersExtraction(self.spots_3d.spots_ints, self.spots_tracked_3d, self.spots_3d.spots_vol)   # spots_3D.spots_vol * np.sign(self.spots_tracked_3D))
 
-            self.nuc_active  =  NucleiSpotsConnection.NucleiSpotsConnection(self.spots_tracked_3d, self.nuclei_tracked)
+            self.nuc_active  =  NucleiSpotsConnection.NucleiSpotsConnection(self.spots_tracked_3d, self.nuclei_tracked, self.track_table)
             pg.image(self.nuc_active.nuclei_active3c)
             pg.plot(self.nuc_active.n_active_vector, symbol='x', pen='r')
 
@@ -588,13 +601,16 @@ class MainWindow(QtWidgets.QMainWindow):
             self.pixsize_x_lbl.setText("pix size XY = " + str(self.raw_data.pix_size_x))
             self.pixsize_z_lbl.setText("Z step = " + str(self.raw_data.pix_size_z))
 
-            self.nuclei_segmented  =  AnalysisLoader.NucleiSegmented(analysis_folder, self.raw_data.green4d)
+            self.segm_cache.clear()                                                                     # segmentations of the previous data are not needed anymore
+            self.segm_keys         =  []
+            self.nuclei_segmented  =  AnalysisLoader.NucleiSegmented(analysis_folder, self.raw_data.green4d, self.raw_data.z_profile)
             self.frame_nucs_sgm.setImage(self.nuclei_segmented.nucs_lbld)
             self.mycmap            =  pg.ColorMap(np.linspace(0, 1, self.nuclei_segmented.nucs_lbld.max()), color=self.colors4map)
             self.frame_nucs_sgm.setColorMap(self.mycmap)
             self.frame_nucs_sgm.setCurrentIndex(self.frame_nucs_raw.currentIndex)
 
             self.nuclei_tracked  =  np.load(analysis_folder + '/nuclei_tracked.npy')
+            self.track_table     =  TrackTable.load(analysis_folder, self.nuclei_tracked, self.nuclei_segmented.nucs_lbld)
             self.popup_nuclei_trackeded()
 
             self.spots_3d  =  AnalysisLoader.SpotsIntsVol(analysis_folder)
@@ -611,7 +627,7 @@ class MainWindow(QtWidgets.QMainWindow):
             self.ipp_3d_av         =  ipp_3d.sum() / float(self.spots_3d.spots_vol.sum())                                                               # ipp is defined just to calculate the average intensity value of the spots, ipp_av
             self.features_3d       =  ParametersExtraction.ParametersExtraction(self.spots_3d.spots_ints, self.spots_tracked_3d, self.spots_3d.spots_vol)   # spots_3D.spots_vol * np.sign(self.spots_tracked_3D))
 
-            self.nuc_active  =  NucleiSpotsConnection.NucleiSpotsConnection(self.spots_tracked_3d, self.nuclei_tracked)
+            self.nuc_active  =  NucleiSpotsConnection.NucleiSpotsConnection(self.spots_tracked_3d, self.nuclei_tracked, self.track_table)
             pg.image(self.nuc_active.nuclei_active3c)
             pg.plot(self.nuc_active.n_active_vector, symbol='x', pen='r')
 
@@ -630,7 +646,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
         try:
             cages_tli     =  BackgroundEstimate.BackgroundEstimate(self.spots_3d.spots_coords, self.spots_tracked_3d, self.raw_data.green4d)
-            AnalysisSaver.AnalysisSaver(folder2write, self.raw_data, self.nucs_spots_channels, self.spots_3d, self.spots_tracked_3d, self.nuclei_tracked, self.nuclei_segmented, self.features_3d, self.nuc_active, cages_tli.cages_tli, self.fnames, self.spots_thr_value, self.volume_thr_value, self.dist_thr_value, self.max_dist, self.software_version)
+            AnalysisSaver.AnalysisSaver(folder2write, self.raw_data, self.nucs_spots_channels, self.spots_3d, self.spots_tracked_3d, self.nuclei_tracked, self.nuclei_segmented, self.features_3d, self.nuc_active, cages_tli.cages_tli, self.fnames, self.spots_thr_value, self.volume_thr_value, self.dist_thr_value, self.max_dist, self.software_version, track_table=self.track_table)
         except Exception:
             traceback.print_exc()
 
@@ -758,12 +774,13 @@ class ModifierCycleTool(QtWidgets.QWidget):
         layout.addWidget(tabs)                                             # tabs is a Widget not a Layout!!!!!
         layout.addLayout(btn_box)
 
-        self.end_pts         =  end_pts
-        self.ar_reg          =  ar_reg
-        self.framepp1        =  framepp1
-        self.framepp2        =  framepp2
-        self.frame_numb_lbl  =  frame_numb_lbl
-        self.c_count         =  0
+        self.end_pts          =  end_pts
+        self.ar_reg           =  ar_reg
+        self.framepp1         =  framepp1
+        self.framepp2         =  framepp2
+        self.frame_numb_lbl   =  frame_numb_lbl
+        self.c_count          =  0
+        self.modified_frames  =  set()                                     # frames touched by manual corrections
 
         self.setLayout(layout)
         self.setGeometry(300, 300, 600, 400)
@@ -776,6 +793,7 @@ class ModifierCycleTool(QtWidgets.QWidget):
 
             cif                                =  self.framepp1.currentIndex
             self.nuclei_seg[cif, :, :]         =  self.bufframe
+            self.modified_frames.add(cif)
             self.framepp1.updateImage()
             self.framepp1.setCurrentIndex(cif)
 
@@ -809,6 +827,7 @@ class ModifierCycleTool(QtWidgets.QWidget):
         end_pts  =  np.array([[int(pp[0].x()), int(pp[0].y())], [int(pp[1].x()), int(pp[1].y())]])
         bufframe                           =  np.copy(self.nuclei_seg[cif, :, :])
         self.nuclei_seg[cif, :, :]         =  LabelsModify.LabelsModify(self.nuclei_seg[cif, :, :], end_pts).labels_fin
+        self.modified_frames.add(cif)
         self.framepp1.updateImage()
         self.bufframe  =  bufframe
 
@@ -945,7 +964,7 @@ class SpatialAnalisys(QtWidgets.QWidget):
     def __init__(self, fnames, analysis_folder):
         QtWidgets.QWidget.__init__(self)
 
-        raw_data  =  MultiLoadCzi5D.MultiLoadCzi5D(fnames, np.load(analysis_folder +  '/nucs_spots_channels.npy'))
+        raw_data  =  RawDataCache.RawDataCache(fnames, np.load(analysis_folder +  '/nucs_spots_channels.npy'))
 
         ksf_h  =  np.load('keys_size_factor.npy')[0]
         ksf_w  =  np.load('keys_size_factor.npy')[1]
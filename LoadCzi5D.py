@@ -3,43 +3,80 @@
 Given the filename of a .lsm file, this function gives as output the matrices
 of the red and green channels maximum intensity projected plus the green channel
 as it is. Inputs are the file-name and the channel number for nuclei and spots.
+Maximum intensity projections keep the dtype of the raw data.
+
+Data are decoded subblock by subblock (each subblock is an x-y plane) directly
+into the output matrices, so that the whole file never needs to be in memory
+twice and several files can be written in the slices of a single matrix.
+Only the requested channels (a channel set to None is skipped), the z planes
+in the window z_range and the time frames in the window t_range are read.
 """
 
 
 import numpy as np
-import czifile
+from czifile import CziFile
 
 
-class LoadCzi5D:
-    """Only class, does all the job."""
-    def __init__(self, fname, nucs_spts_ch):
+def czi_dims(czi):
+    """Read from the header the sizes of channel, time, z, x and y dimensions of an opened czi file (x are rows, y columns)."""
+    return tuple(int(czi.shape[czi.axes.index(dim)]) if dim in czi.axes else 1 for dim in "CTZYX")
+
 
-        file_array  =  np.squeeze(czifile.imread(fname))
+def planes_index(czi):
+    """Index the subblock directory of an opened czi file.
 
-        if len(file_array.shape)  == 5:                                                             # case you have more than a time frame
-            c, steps, z, x_len, y_len  =  file_array.shape
+    Output is a (n, 6) matrix: for each subblock, its channel, time, z, x and y
+    offsets plus its position in the subblock directory.
+    """
+    start   =  np.asarray(czi.start)
+    planes  =  []
+    for cnt, entry in enumerate(czi.filtered_subblock_directory):
+        offs  =  np.asarray(entry.start) - start                                                    # offsets of the subblock with respect to the origin of the file
+        planes.append([offs[czi.axes.index(dim)] if dim in czi.axes else 0 for dim in "CTZYX"] + [cnt])
+    return np.asarray(planes, dtype=np.int64).reshape((-1, 6))
 
-            red_mtx    =  np.zeros((steps, x_len, y_len), dtype=np.int32)
-            green_mtx  =  np.zeros((steps, x_len, y_len), dtype=np.int32)
 
-            for t in range(steps):                                                                  # maximum intensity projection
-                for x in range(x_len):
-                    red_mtx[t, x, :]    =  file_array[nucs_spts_ch[0], t, :, x, :].max(0)
-                    green_mtx[t, x, :]  =  file_array[nucs_spts_ch[1], t, :, x, :].max(0)
-            self.green4d  =  file_array[nucs_spts_ch[1], :, :, :, :]
-            self.red4d    =  file_array[nucs_spts_ch[0], :, :, :, :]
+def read_planes(czi, planes, channels, mtxs, z_range=None, t_range=None, transpose=False):
+    """Decode the subblocks of the given channels of an opened czi file directly into their (t, z, x, y) matrices.
 
-        else:                                                                                       # case you have just one time frame
-            c, z, x_len, y_len  =  file_array.shape
+    Subblocks of other channels, out of the z window z_range = [first, last)
+    or out of the time window t_range = [first, last) are not read at all.
+    With transpose=True planes are written transposed, (t, z, y, x): this is
+    the ImageJ orientation, obtained while decoding and without extra copies.
+    """
+    z_first, z_last  =  (0, np.inf) if z_range is None else z_range
+    t_first, t_last  =  (0, np.inf) if t_range is None else t_range
+    entries          =  czi.filtered_subblock_directory
+    for c, t, z, x0, y0, idx in planes:
+        if c not in channels or not z_first <= z < z_last or not t_first <= t < t_last:           # subblock we don't use
+            continue
+        tile  =  entries[idx].data_segment().data()
+        tile  =  tile.reshape(tile.shape[-3:-1])                                                    # (x, y) plane
+        for ch, mtx in zip(channels, mtxs):
+            if c == ch and transpose:
+                mtx[t - t_first, z - z_first, y0:y0 + tile.shape[1], x0:x0 + tile.shape[0]]  =  tile.T
+            elif c == ch:
+                mtx[t - t_first, z - z_first, x0:x0 + tile.shape[0], y0:y0 + tile.shape[1]]  =  tile
+
+
+class LoadCzi5D:
+    """Only class, does all the job."""
+    def __init__(self, fname, nucs_spts_ch, z_range=None):
 
-            red_mtx    =  np.zeros((x_len, y_len))
-            green_mtx  =  np.zeros((x_len, y_len))
+        with CziFile(fname) as czi:
+            c, steps, z, x_len, y_len  =  czi_dims(czi)
+            z_first, z_last            =  (0, z) if z_range is None else (max(z_range[0], 0), min(z_range[1], z))
+            mtxs                       =  [None if ch is None else np.zeros((steps, z_last - z_first, x_len, y_len), dtype=czi.dtype) for ch in nucs_spts_ch]   # a channel set to None is not decoded
+            read_planes(czi, planes_index(czi), [ch for ch in nucs_spts_ch if ch is not None], [mtx for mtx in mtxs if mtx is not None], (z_first, z_last))
 
-            for x in range(x_len):                                                                  # maximum intensity projection
-                red_mtx[x, :]    =  file_array[nucs_spts_ch[0], :, x, :].max(0)
-                green_mtx[x, :]  =  file_array[nucs_spts_ch[1], :, x, :].max(0)
+        red4d, green4d  =  mtxs
+        mips            =  [None if mtx is None else mtx.max(axis=1) for mtx in mtxs]                 # maximum intensity projection along z
 
-            self.green4d    =  file_array[nucs_spts_ch[1], :, :, :]
+        if steps == 1:                                                                              # case you have just one time frame: remove the time dimension
+            red4d, green4d  =  [None if mtx is None else mtx[0] for mtx in mtxs]
+            mips            =  [None if mip is None else mip[0] for mip in mips]
 
-        self.red_mtx    =  red_mtx
-        self.green_mtx  =  green_mtx
+        self.green4d    =  green4d
+        self.red4d      =  red4d
+        self.red_mtx    =  mips[0]
+        self.green_mtx  =  mips[1]
@@ -3,24 +3,36 @@
 Taking .czi filenames as input, the output are the concatenated matrices of the
 maximum intensity projection of red and green channels plus the green channel in
 4D (because of 3D detection purpouses). Matrices are also flipped and rotate to
-have a visualization conform to ImageJ standards. In order to avoid to use 3D
-and 4D matrices for concatenation (cumbersome to handle) the matrices are
-always reshaped in a 1D vector, concatenated and reshaped at the end into
-a matrix shape.
+have a visualization conform to ImageJ standards.
 """
 
 
-# import multiprocessing
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import numpy as np
 from czifile import CziFile
 
 import LoadCzi5D
+import LazyCzi4D
+import CziMetadata
 import UsefulWidgets
 
 
+def read_file(job_args):
+    """Decode a .czi file into its time slices of the final matrices (job of the pool)."""
+    fname, channels, mtxs, z_range, t_range  =  job_args
+    with CziFile(str(fname)) as czi:
+        LoadCzi5D.read_planes(czi, LoadCzi5D.planes_index(czi), channels, mtxs, z_range, t_range, transpose=True)
+
+
 class MultiLoadCzi5D:
-    """Core of multi loading function"""
-    def __init__(self, fnames, nucs_spts_ch):
+    """Core of multi loading function.
+
+    With lazy=True the 4D matrices are LazyCzi4D objects; z_range and
+    frame_range = [first, last) restrict decoding to a window of z planes and
+    of frames, a channel set to None is not decoded (its matrices are None).
+    """
+    def __init__(self, fnames, nucs_spts_ch, n_workers=None, lazy=False, z_range=None, frame_range=None):
 
         # fnames           =  fnames_chs[0]
         # nucs_spts_ch     =  fnames_chs[1]
@@ -30,100 +42,70 @@ class MultiLoadCzi5D:
         pix_size_z       =  None
 
         if len(fnames) > 0:                                                             # it can be zero when used in multiprocessing
-            t_steps_done  =  False                                                      # flag for time steps reading
-            mt_buff       =  LoadCzi5D.LoadCzi5D(str(fnames[0]), nucs_spts_ch)          # read first .czi file
-
-            imarray_red    =  mt_buff.red_mtx                                           # separate its different channels
-            imarray_green  =  mt_buff.green_mtx
-            green4d        =  mt_buff.green4d
-            red4d          =  mt_buff.red4d
+            metas   =  [CziMetadata.CziMetadata(fname) for fname in fnames]             # first phase: read the shape of each file from the header only (cached)
+            t_lens  =  [meta.dims[1] for meta in metas]
+            c, t_len, z_steps, xlen, ylen  =  metas[-1].dims
+            dtype                          =  metas[0].dtype
+            f_first, f_last  =  (0, sum(t_lens)) if frame_range is None else (max(frame_range[0], 0), min(frame_range[1], sum(t_lens)))
+            time_steps       =  f_last - f_first
+            z_first, z_last  =  (0, z_steps) if z_range is None else (max(z_range[0], 0), min(z_range[1], z_steps))
+            channels         =  [ch for ch in nucs_spts_ch if ch is not None]
+
+            if lazy:
+                red4d, green4d  =  [None if ch is None else LazyCzi4D.LazyCzi4D(fnames, ch, (z_first, z_last))[f_first:f_last] for ch in nucs_spts_ch]    # lazy matrices, already in the imageJ format
+                mips            =  [None if ch is None else np.zeros((time_steps, ylen, xlen), dtype=dtype) for ch in nucs_spts_ch]
+                z_profile       =  None if green4d is None else np.zeros((time_steps, z_last - z_first), dtype=np.uint64)
+                for t in range(time_steps):                                             # maximum intensity projections frame by frame (one frame in memory at a time)
+                    for mtx, mip in zip([red4d, green4d], mips):
+                        if mtx is not None:
+                            frame   =  mtx[t]
+                            mip[t]  =  frame.max(axis=0)
+                            if mtx is green4d:
+                                z_profile[t]  =  frame.sum(axis=(1, 2))
+                imarray_red, imarray_green  =  mips
 
-            if len(mt_buff.red_mtx.shape) == 2:                                         # store info about size: if a file has just one time frame, it will have one dimension less
-                time_steps           =  1
-                z_steps, xlen, ylen  =  green4d.shape
             else:
-                time_steps, z_steps, xlen, ylen  =  green4d.shape
-                with CziFile(str(fnames[0])) as czi:
-                    for attachment in czi.attachments():
-                        if attachment.attachment_entry.name == 'TimeStamps':
-                            timestamps  =  attachment.data()
-                            break
-                    else:
-                        raise ValueError('TimeStamps not found')
-
-                time_step_value  =  np.round(timestamps[1] - timestamps[0], 2)    # time step value
-                t_steps_done     =  True                                          # prevent to read it again from other files (useless)
-
-            imarray_red    =  imarray_red.reshape(imarray_red.size)                     # reshape all the matrix we declare into a 1D vector
-            imarray_green  =  imarray_green.reshape(imarray_green.size)
-            green4d        =  green4d.reshape(green4d.size)
-            red4d          =  red4d.reshape(red4d.size)
-
-            if len(fnames) > 1:
-                for s in range(1, len(fnames)):                                         # reading further files (if any)
-
-                    mt_buff  =  LoadCzi5D.LoadCzi5D(str(fnames[s]), nucs_spts_ch)
-                    if len(mt_buff.red_mtx.shape) == 2:                                 # store info about the matrix size
-                        t_steps_bff  =  1
-                    else:
-                        t_steps_bff  =  mt_buff.green4d.shape[0]
-
-                        if t_steps_done is False:                                       # read the time step value on the first file that has more than 1 time frame
-                            with CziFile(str(fnames[s])) as czi:
-                                for attachment in czi.attachments():
-                                    if attachment.attachment_entry.name == 'TimeStamps':
-                                        timestamps = attachment.data()
-                                        break
-                                else:
-                                    raise ValueError('TimeStamps not found')
-
-                            time_step_value  =  np.round(timestamps[1] - timestamps[0], 2)    # time step value
-                            t_steps_done     =  True                                          # prevent to read it again from other files (useless)
-
-                    imarray_red    =  np.append(imarray_red, mt_buff.red_mtx.reshape(mt_buff.red_mtx.size))                      # append new data to previous
-                    imarray_green  =  np.append(imarray_green, mt_buff.green_mtx.reshape(mt_buff.green_mtx.size))
-                    green4d        =  np.append(green4d, mt_buff.green4d.reshape(mt_buff.green4d.size))
-                    red4d        =  np.append(red4d, mt_buff.red4d.reshape(mt_buff.red4d.size))
-
-                    time_steps  +=  t_steps_bff
-
-            imarray_red    =  imarray_red.reshape((time_steps, xlen, ylen))                                                     # final reshape of the matrioces
-            imarray_green  =  imarray_green.reshape((time_steps, xlen, ylen))
-            green4d        =  green4d.reshape((time_steps, z_steps, xlen, ylen))
-            red4d          =  red4d.reshape((time_steps, z_steps, xlen, ylen))
-
-            imarray_red    =  np.rot90(imarray_red, axes=(1, 2))[:, ::-1, :]                                                    # rotation to adapt to the imageJ format
-            imarray_green  =  np.rot90(imarray_green, axes=(1, 2))[:, ::-1, :]
-            green4d        =  np.rot90(green4d, axes=(2, 3))[:, :, ::-1, :]
-            red4d          =  np.rot90(red4d, axes=(2, 3))[:, :, ::-1, :]
-
-            a      =  CziFile(str(fnames[0]))                                                                                   # read info about pixel size
-            b      =  a.metadata()
-            start  =  b.find("ScalingZ")
-            end    =  b[start + 9:].find("ScalingZ")
-
-            if start != -1:
-                pix_size_z  =  np.round(float(b[start + 9:start + 7 + end]) * 1000000, 4)
-                start       =  b.find("ScalingX")
-                end         =  b[start + 9:].find("ScalingX")
-                pix_size_x  =  np.round(float(b[start + 9:start + 7 + end]) * 1000000, 4)
-            elif start == -1:                                                                   # in case metadata file are not easy to read
-                start2  =  b.find('<Distance Id="X"')
-                if start2 != -1:
-                    kk          =  b[start2:].find('</Value>')
-                    pix_size_x  =  np.round(float(b[start2 + 35:start2 + kk]) * 1000000, 4)
-                    cc          =  b.find('<Distance Id="Z">')
-                    cc1         =  b[cc:].find('<Value>')
-                    cc2         =  b[cc:].find('</Value>')
-                    pix_size_z  =  np.round(float(b[cc + cc1 + 7:cc + cc2]) * 1000000, 4)
-                elif start2 == -1:                                                               # in case metadata file are not easy to read
-                    [pix_size_x, pix_size_z]  =  UsefulWidgets.SetPixelSize().getPixelsValues()
-
-            self.time_steps       =  time_steps
-            self.pix_size_x       =  pix_size_x
-            self.pix_size_z       =  pix_size_z
-            self.time_step_value  =  time_step_value
-            self.imarray_red      =  imarray_red
-            self.imarray_green    =  imarray_green
-            self.green4d          =  green4d
-            self.red4d            =  red4d
+                mtxs      =  [None if ch is None else np.zeros((time_steps, z_last - z_first, ylen, xlen), dtype=dtype) for ch in nucs_spts_ch]    # allocate the final matrices once, already in the imageJ format
+                t_starts  =  np.cumsum([0] + t_lens)
+                job_args  =  []
+                for cnt, fname in enumerate(fnames):                                    # second phase: each file is decoded directly into its time slice (natsorted order is kept by the slices)
+                    t_first, t_last  =  max(t_starts[cnt], f_first), min(t_starts[cnt + 1], f_last)    # part of the file inside the frame range (global frame numbers)
+                    if t_first < t_last:
+                        job_args.append([fname, channels, [mtx[t_first - f_first:t_last - f_first] for mtx in mtxs if mtx is not None], (z_first, z_last), (t_first - t_starts[cnt], t_last - t_starts[cnt])])
+
+                if n_workers is None:
+                    n_workers  =  multiprocessing.cpu_count()
+                n_workers  =  min(n_workers, len(job_args))
+                if n_workers > 1:                                                       # decompression works concurrently, all the threads write in the same matrices
+                    pool  =  ThreadPool(n_workers)
+                    pool.map(read_file, job_args)
+                    pool.close()
+                else:
+                    for job_arg in job_args:
+                        read_file(job_arg)
+
+                red4d, green4d              =  mtxs                                                                                     # planes are transposed while decoding: C-contiguous matrices
+                imarray_red, imarray_green  =  [None if mtx is None else mtx.max(axis=1) for mtx in [red4d, green4d]]                       # maximum intensity projections
+                z_profile                   =  None if green4d is None else green4d.sum(axis=(2, 3), dtype=np.uint64)                    # z profile of the green channel
+
+            for fname, meta in zip(fnames, metas):                                      # read the time step value on the first file that has more than 1 time frame
+                if meta.dims[1] > 1:
+                    if meta.time_step_value is None:
+                        raise ValueError('TimeStamps not found in ' + str(fname))
+                    time_step_value  =  meta.time_step_value
+                    break
+
+            pix_size_x, pix_size_z  =  metas[0].pix_size_x, metas[0].pix_size_z                # pixel size from the xml metadata of the first file
+            if pix_size_x is None or pix_size_z is None:                                        # in case metadata file are not easy to read
+                [pix_size_x, pix_size_z]  =  UsefulWidgets.SetPixelSize().getPixelsValues()
+
+            self.time_steps        =  time_steps
+            self.first_last_frame  =  np.array([f_first, f_last])
+            self.pix_size_x        =  pix_size_x
+            self.pix_size_z        =  pix_size_z
+            self.time_step_value   =  time_step_value
+            self.imarray_red       =  imarray_red
+            self.imarray_green     =  imarray_green
+            self.green4d           =  green4d
+            self.red4d             =  red4d
+            self.z_profile         =  z_profile
@@ -4,51 +4,111 @@ Starting from a time series of already detected and segmented nuclei,
 it tracks them using the positions of the center of mass of nuclei in consecutive
 time frames. The closest are associated. There is a threshold on the distance to
 avoid misleading associations.
+Centroids are tabulated once per frame and the close centroid pairs of two
+consecutive frames are found with a single query (DistancesP2Vec): tracks are
+extended in the order they started (and, inside a frame, in the order of the
+labels), each one taking the closest nucleus not yet taken by another track.
+Tags are then painted with a lookup table, one pass per frame, and the tracked
+nuclei are also given as a table (TrackTable).
+Frames are tracked one at a time by NucleiTracker, which keeps only the state
+of the previous frame: it can also track frames while they are segmented.
 """
 
 
-from importlib import reload
 import numpy as np
-from skimage.measure import regionprops
+from skimage.measure import regionprops_table
 
-import NucleiConnectSingle
+import DistancesP2Vec
+import TrackTable
 
 
-class NucleiConnect:
-    def __init__(self, input_args):
+def frame_centroids(nucs):
+    """Rounded centroids of the nuclei of a frame and the tag found at each of them.
 
-        reload(NucleiConnectSingle)
-        nuclei    =  input_args[0].astype(np.int32)
-        dist_thr  =  input_args[1]
-        t_tot  =  nuclei.shape[0]
-        ctrs   =  np.zeros((t_tot, 2, nuclei.max()))
+    When the centroid is outside any nucleus, the centroid pixel takes the
+    only tag found in its 3x3 neighbourhood (nucs is modified); nuclei for
+    which no single tag is found are left out. Output are the centroids (Nx2)
+    and the tags (N), in the order of the labels.
+    """
+    rgp   =  regionprops_table(nucs, properties=["centroid"])
+    ctrs  =  np.round(np.stack([rgp["centroid-0"], rgp["centroid-1"]], axis=1)).astype(np.int32).reshape(-1, 2)
+    tags  =  nucs[ctrs[:, 0], ctrs[:, 1]]
+    for j in np.where(tags == 0)[0]:                                                            # centroid outside the nucleus (concave shapes)
+        bff_square  =  np.trim_zeros(np.unique(nucs[ctrs[j, 0] - 1:ctrs[j, 0] + 2, ctrs[j, 1] - 1:ctrs[j, 1] + 2]))
+        if bff_square.size == 1:
+            nucs[ctrs[j, 0], ctrs[j, 1]]  =  bff_square[0]
+            tags[j]                       =  bff_square[0]
+    return ctrs[tags > 0], tags[tags > 0]
 
-        for tt in range(t_tot):
-            # rgp    =  regionprops(nuclei[tt, :, :].astype(np.int))
-            rgp    =  regionprops(nuclei[tt, :, :])
-            for j in range(len(rgp)):
-                if nuclei[tt, np.round(rgp[j]['Centroid'][0]).astype(np.int32), np.round(rgp[j]['Centroid'][1]).astype(np.int32)] > 0:
-                    ctrs[tt, :, j]  =  rgp[j]['Centroid']
-                else:
-                    bff_square  =  nuclei[tt, np.round(rgp[j]['Centroid'][0]).astype(np.int32) - 1:np.round(rgp[j]['Centroid'][0]).astype(np.int32) + 2, np.round(rgp[j]['Centroid'][1]).astype(np.int32) - 1:np.round(rgp[j]['Centroid'][1]).astype(np.int32) + 2]
 
-                    bff_square  =  np.unique(bff_square)
-                    bff_square  =  np.trim_zeros(bff_square)
+def link_frames(ctrs1, tracks1, ctrs2, dist_thr, next_id):
+    """Link the nuclei of a frame to the ones of the following frame.
+
+    ctrs1 and tracks1 are centroids and track tags of the first frame, ctrs2
+    the centroids of the second one. Tracks are served in increasing tag order,
+    each one takes the closest free nucleus (the first one in case of parity)
+    closer than dist_thr. Nuclei left free start new tracks, tagged from next_id.
+    Output are the track tags of the second frame.
+    """
+    tracks2            =  np.zeros(ctrs2.shape[0], dtype=np.int64)
+    linked             =  np.zeros(ctrs1.shape[0], dtype=bool)
+    idx1, idx2, dists  =  DistancesP2Vec.close_pairs(ctrs1, ctrs2, dist_thr)                    # all the candidate pairs of the two frames in one query
+    rank               =  np.argsort(np.argsort(tracks1, kind="stable"))                         # serving order of the tracks
+    order              =  np.lexsort((idx2, dists, rank[idx1]))                                  # by track, then closest first
+    for i, j in zip(idx1[order], idx2[order]):
+        if not linked[i] and tracks2[j] == 0:                                                    # each track takes its first free nucleus
+            tracks2[j]  =  tracks1[i]
+            linked[i]   =  True
+
+    new_ones           =  np.where(tracks2 == 0)[0]
+    tracks2[new_ones]  =  next_id + np.arange(new_ones.size)
+    return tracks2
+
+
+class NucleiTracker:
+    """Online tracker: segmented frames are given one at a time, in time order.
+
+    Only the centroids and the track tags of the previous frame are kept, so
+    frames can be tracked while the following ones are being segmented.
+    """
+    def __init__(self, dist_thr):
 
-                    if bff_square > 0:
-                        nuclei[tt, np.round(rgp[j]['Centroid'][0]).astype(np.int32), np.round(rgp[j]['Centroid'][1]).astype(np.int32)]  =  bff_square
-                        ctrs[tt, :, j]  =  rgp[j]['Centroid']
+        self.dist_thr  =  dist_thr
+        self.t         =  0
+        self.next_id   =  1
+        self.ctrs1     =  np.zeros((0, 2), dtype=np.int32)
+        self.tracks1   =  np.zeros(0, dtype=np.int64)
 
-        nuclei_tracked     =  np.zeros(nuclei.shape, dtype=np.int32)
+    def track_frame(self, nucs):
+        """Track the next frame: output are the tracked frame (int32) and its track table."""
+        nucs          =  np.array(nucs, dtype=np.int32)                                             # copy: frame_centroids can modify it
+        ctrs2, tags2  =  frame_centroids(nucs)
+        tracks2       =  link_frames(self.ctrs1, self.tracks1, ctrs2, self.dist_thr, self.next_id)
+        self.next_id  =  max(self.next_id, tracks2.max(initial=0) + 1)
 
-        k  =  0
-        while ctrs[:-1, :, :].sum() > 0:
-            [t, i_ref]  =  np.argwhere(ctrs.sum(1) != 0)[0]
-            bffr_data   =  NucleiConnectSingle.NucleiConnectSingle(ctrs, nuclei, i_ref, t, dist_thr)
+        lut  =  np.zeros(nucs.max(initial=0) + 1, dtype=np.int32)                                    # frame tags to track tags
+        np.add.at(lut, tags2, tracks2)
+        trck_frame  =  lut[nucs]
+        table       =  TrackTable.frame_table(trck_frame, nucs, self.t)
 
-            if bffr_data.labbs2.sum() > 0:
-                nuclei_tracked  +=  (k + 1) * bffr_data.labbs2
-                ctrs            =   bffr_data.ctrs
-                k               +=  1
+        self.ctrs1, self.tracks1  =  ctrs2, tracks2
+        self.t                    +=  1
+        return trck_frame, table
+
+
+class NucleiConnect:
+    def __init__(self, input_args):
+
+        nuclei    =  input_args[0]
+        dist_thr  =  input_args[1]
+        t_tot     =  nuclei.shape[0]
+
+        nuclei_tracked  =  np.zeros(nuclei.shape, dtype=np.int32)
+        tracker         =  NucleiTracker(dist_thr)
+        tables          =  []
+        for tt in range(t_tot):
+            nuclei_tracked[tt], table  =  tracker.track_frame(nuclei[tt])
+            tables.append(table)
 
         self.nuclei_tracked         =  nuclei_tracked
+        self.track_table            =  TrackTable.concatenate(tables)
@@ -2,6 +2,12 @@
 
 It just coordinates the previous function 'NucleiConnect' to work in a
 multiprocessing pool.
+Blocks are stitched at their interface (last frame of a block versus first
+frame of the following one) with the contingency table of the overlapping
+tags of the two frames: each tag of the first frame of a block takes the
+median of the tags it overlaps, and the whole block is relabeled with a
+single lookup table (LabelsRemap); the same table relabels the track table
+of the block.
 """
 
 
@@ -10,6 +16,30 @@ from importlib import reload
 import numpy as np
 
 import NucleiConnect
+import TrackTable
+import LabelsRemap
+
+
+def seam_lut(frame_prev, frame_next, lbls_max):
+    """Lookup table of the tags of frame_next onto the tags of frame_prev.
+
+    Each tag of frame_next takes the median of the (nonzero) tags of frame_prev
+    it overlaps, pixel by pixel, computed from the contingency table of the two
+    frames; tags without overlap go to 0. lbls_max is the maximum tag of the
+    block of frame_next (size of the table).
+    """
+    ovrlp        =  (frame_prev > 0) & (frame_next > 0)
+    pairs, cnts  =  np.unique(np.stack([frame_next[ovrlp], frame_prev[ovrlp]]).astype(np.int64), axis=1, return_counts=True)     # contingency table: (tag next, tag prev) pairs and their pixel counts
+    lut          =  np.zeros(lbls_max + 1, dtype=np.int32)
+    if cnts.size > 0:
+        tags, strt  =  np.unique(pairs[0], return_index=True)                                         # pairs are sorted by tag next, then by tag prev
+        n_pxls      =  np.add.reduceat(cnts, strt)
+        cum_cnts    =  np.cumsum(cnts)
+        offs        =  cum_cnts[strt] - cnts[strt]                                                    # pairs of the table before each tag
+        lo          =  pairs[1, np.searchsorted(cum_cnts, offs + (n_pxls - 1) // 2, side="right")]    # the two central values of the sorted overlapped tags
+        hi          =  pairs[1, np.searchsorted(cum_cnts, offs + n_pxls // 2, side="right")]
+        lut[tags]   =  (lo + hi) // 2
+    return lut
 
 
 class NucleiConnectMultiCore:
@@ -31,22 +61,22 @@ class NucleiConnectMultiCore:
 
             nuclei_tracked                           =  np.zeros(nuclei_seg.shape, dtype=np.int32)
             nuclei_tracked[chops[0]:chops[1], :, :]  =  results[0].nuclei_tracked
+            tables                                   =  [results[0].track_table]
 
-            for t in range(1, cpu_ow):
-                idx  =  np.unique(results[t].nuclei_tracked[0, :, :])[1:]                                       # after pooling, results must be concatenate but saving the correct tag for each nucleus:
-                for k in idx:                                                                                   # here we work at the interface (last frame versus first frame of the following results block)
-                    tag  =  (nuclei_tracked[chops[t] - 1, :, :] * (results[t].nuclei_tracked[0, :, :] == k))
-                    tag  =  tag.reshape(tag.size)
-                    tag  =  np.delete(tag, np.where(tag == 0))
-                    if tag.size > 0:
-                        tag  =  np.median(tag).astype(np.int32)
-                        nuclei_tracked[chops[t]:chops[t + 1], :, :]  +=  (results[t].nuclei_tracked == k) * tag
+            for t in range(1, cpu_ow):                                                                          # after pooling, results must be concatenate but saving the correct tag for each nucleus:
+                lut                                          =  seam_lut(nuclei_tracked[chops[t] - 1], results[t].nuclei_tracked[0], results[t].nuclei_tracked.max())    # here we work at the interface (last frame versus first frame of the following results block)
+                LabelsRemap.remap(results[t].nuclei_tracked, lut, out=nuclei_tracked[chops[t]:chops[t + 1], :, :])
+                tables.append(results[t].track_table.remap(lut, chops[t]))
+            track_table  =  TrackTable.concatenate(tables)
 
         else:
-            nuclei_tracked  =  NucleiConnect.NucleiConnect([nuclei_seg, dist_thr]).nuclei_tracked
+            bffr            =  NucleiConnect.NucleiConnect([nuclei_seg, dist_thr])
+            nuclei_tracked  =  bffr.nuclei_tracked
+            track_table     =  bffr.track_table
 
         # mycmap                 =  np.fromfile("mycmap.bin", "uint16").reshape((10000, 3)) / 255.0
         # nuclei_tracked_visual  =  label2rgb(nuclei_tracked, bg_label=0, bg_color=[0, 0, 0], colors=mycmap)
 
         self.nuclei_tracked         =  nuclei_tracked
+        self.track_table            =  track_table
         # self.nuclei_tracked_visual  =  nuclei_tracked_visual
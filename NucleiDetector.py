@@ -4,122 +4,392 @@ Nuclei here are obtained from the holes of singals in green channel.
 Input is the TxZxXxY, out put is the matrix-video of the detected nuclei.
 """
 
+import hashlib
+import collections
+import multiprocessing
+from functools import partial
 import numpy as np
-from skimage.filters import gaussian,hessian, threshold_otsu
-from skimage.morphology import remove_small_holes, label, binary_erosion, disk, closing
+from skimage.filters import gaussian,hessian
+from skimage.morphology import label, binary_erosion, disk, closing
 from skimage.measure import regionprops_table
 from skimage.feature import peak_local_max
-from skimage.segmentation import watershed, expand_labels
+from skimage.segmentation import watershed
 from scipy import ndimage
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
 import UsefulWidgets
+import FrameSource
+import ZSlab
+import NucleiConnect
+import TrackTable
+
+
+WORK_BUFFERS  =  {}                                                                                                     # intermediate matrices reused frame after frame during a run (one set per worker process)
+
+
+def split_nuclei(nucs2work, offset=(0, 0)):
+    """Watershed of touching nuclei: output are the markers (from the local maxima of the distance matrix) and the split nuclei, tagged as the markers.
+
+    offset is the position of nucs2work in the frame when it is a crop: centroids are rounded in frame coordinates.
+    """
+    xlen, ylen  =  nucs2work.shape
+    nucs_bff      =  binary_erosion(np.sign(nucs2work)) * nucs2work                                                     # binary erosion of the nuclei to correct to reduce the errors (strange shapes can lead to bad segmentation)
+    distance      =  ndimage.distance_transform_edt(nucs_bff)                                                           # distance matrix for the watershed
+    l_maxi_crd    =  peak_local_max(distance, footprint=np.ones((7, 7)), labels=label(nucs_bff))                        # search the local maxima (this is a list of coordinates)
+    local_maxi    =  np.zeros((xlen, ylen), dtype=np.uint8)                                                             # local maxima as a matrix, initialization
+    for ll in l_maxi_crd:
+        local_maxi[ll[0], ll[1]]  =  1                                                                                  # put 1 in corrispondence of the peaks
+    local_mx      =  gaussian(local_maxi, 1) > 0                                                                        # gaussian blurring for the local maxima matrix to avoid to ahve 2 very close peaks
+    local_mx_lbl  =  label(local_mx, connectivity=1).astype(np.int32)                                                   # label of the local maxima matrix
+    local_mx_rgp  =  regionprops_table(local_mx_lbl, properties=["centroid"])                                           # regionprops to extract the centroisd
+
+    ctrs_mx       =  np.zeros((xlen, ylen))                                                                             # initialize centroids matrix
+    for cnt, jj in enumerate(local_mx_rgp["centroid-0"]):
+        ctrs_mx[np.round(jj + offset[0]).astype(np.int32) - offset[0], np.round(local_mx_rgp['centroid-1'][cnt] + offset[1]).astype(np.int32) - offset[1]]  =  1    # put 1 in corrispondence of the peaks
+    markers       =  label(ctrs_mx)                                                                                     # markers matrix
+    fin_bff       =  watershed(-distance, markers, mask=np.sign(nucs2work))                                             # finally watershed
+
+    return markers, fin_bff
+
+
+def split_nuclei_cropped(nucs2work, margin=8):
+    """Watershed of touching nuclei done on the bounding box (plus margin) of each cluster of nuclei, results are pasted back in the frame.
+
+    Nuclei closer than 2 * margin are processed together in the same crop and
+    markers are numbered in the raster order of the whole frame: results are
+    the same of the watershed on the full frame (markers are linked within 8
+    pixels, the margin must be at least 4).
+    """
+    xlen, ylen  =  nucs2work.shape
+    boxes       =  np.zeros((xlen, ylen), dtype=bool)                                                                   # bounding boxes plus margin of the nuclei to work on
+    for sl in ndimage.find_objects(nucs2work):
+        if sl is not None:
+            boxes[max(sl[0].start - margin, 0):sl[0].stop + margin, max(sl[1].start - margin, 0):sl[1].stop + margin]  =  True
+    clusters, n_clusters  =  ndimage.label(boxes)                                                                       # overlapping boxes are joined in a single crop
+
+    crops_res  =  []
+    for cl, sl in enumerate(ndimage.find_objects(clusters)):                                                            # watershed on each crop (nuclei of other clusters falling in the crop are masked out)
+        markers, fin_crop  =  split_nuclei(nucs2work[sl] * (clusters[sl] == cl + 1), (sl[0].start, sl[1].start))
+        rows, cols         =  np.ogrid[sl[0], sl[1]]
+        firsts             =  ndimage.minimum(np.broadcast_to(rows * ylen + cols, markers.shape), markers, np.arange(1, markers.max() + 1))    # first pixel (raster order of the frame) of each marker
+        crops_res.append([sl, fin_crop, np.asarray(firsts, dtype=np.int64).reshape(-1)])
+
+    firsts_all  =  np.concatenate([np.zeros(0, dtype=np.int64)] + [res[2] for res in crops_res])
+    tags        =  np.zeros(firsts_all.size, dtype=np.int64)
+    tags[np.argsort(firsts_all)]  =  np.arange(1, firsts_all.size + 1)                                                  # tags of the markers as if they were labeled on the full frame
+    fin_bff     =  np.zeros((xlen, ylen), dtype=np.uint32)
+    start       =  0
+    for sl, fin_crop, firsts in crops_res:                                                                              # paste the results back with the frame tags
+        lut            =  np.concatenate([[0], tags[start:start + firsts.size]])
+        start         +=  firsts.size
+        fin_view       =  fin_bff[sl]                                                                                   # view: writing in it writes in fin_bff
+        jj             =  fin_crop > 0
+        fin_view[jj]   =  lut[fin_crop[jj]]
+
+    return fin_bff
+
+
+def tile_slices(shape, tile, halo=0):
+    """Tiles covering a 2D frame.
+
+    For each tile, output are the slices of the tile plus halo in the frame, of
+    the tile in the frame and of the tile inside the tile plus halo.
+    """
+    tiles  =  []
+    for x0 in range(0, shape[0], tile):
+        for y0 in range(0, shape[1], tile):
+            x1, y1    =  min(x0 + tile, shape[0]), min(y0 + tile, shape[1])
+            hx0, hy0  =  max(x0 - halo, 0), max(y0 - halo, 0)
+            hx1, hy1  =  min(x1 + halo, shape[0]), min(y1 + halo, shape[1])
+            tiles.append([(slice(hx0, hx1), slice(hy0, hy1)), (slice(x0, x1), slice(y0, y1)), (slice(x0 - hx0, x1 - hx0), slice(y0 - hy0, y1 - hy0))])
+    return tiles
+
+
+def label_tiled(mask, tile, connectivity=1):
+    """Label a 2D mask tile by tile, joining the labels touching across tile borders: output is the same of label(mask, connectivity)."""
+    xlen, ylen  =  mask.shape
+    lbls        =  np.zeros((xlen, ylen), dtype=np.uint32)
+    firsts      =  [np.zeros(1, dtype=np.int64)]                                                                        # first pixel (raster order of the frame) of each tile label
+    n_lbls      =  0
+    for _, core_sl, _ in tile_slices(mask.shape, tile):
+        lbls_bff        =  label(mask[core_sl], connectivity=connectivity)
+        n_bff           =  lbls_bff.max()
+        rows, cols      =  np.ogrid[core_sl[0], core_sl[1]]
+        firsts.append(np.asarray(ndimage.minimum(np.broadcast_to(rows * ylen + cols, lbls_bff.shape), lbls_bff, np.arange(1, n_bff + 1)), dtype=np.int64).reshape(-1))
+        lbls[core_sl]   =  np.where(lbls_bff > 0, lbls_bff + n_lbls, 0)
+        n_lbls         +=  n_bff
+
+    pairs  =  [np.zeros((0, 2), dtype=np.int64)]                                                                        # couples of labels touching across tile borders
+    for cut in range(tile, xlen, tile):
+        sides  =  [(lbls[cut - 1], lbls[cut])] if connectivity == 1 else [(lbls[cut - 1], lbls[cut]), (lbls[cut - 1, :-1], lbls[cut, 1:]), (lbls[cut - 1, 1:], lbls[cut, :-1])]
+        pairs  +=  [np.column_stack([aa[(aa > 0) & (bb > 0)], bb[(aa > 0) & (bb > 0)]]) for aa, bb in sides]
+    for cut in range(tile, ylen, tile):
+        sides  =  [(lbls[:, cut - 1], lbls[:, cut])] if connectivity == 1 else [(lbls[:, cut - 1], lbls[:, cut]), (lbls[:-1, cut - 1], lbls[1:, cut]), (lbls[1:, cut - 1], lbls[:-1, cut])]
+        pairs  +=  [np.column_stack([aa[(aa > 0) & (bb > 0)], bb[(aa > 0) & (bb > 0)]]) for aa, bb in sides]
+    pairs  =  np.concatenate(pairs).astype(np.int64)
+
+    graph         =  coo_matrix((np.ones(pairs.shape[0]), (pairs[:, 0], pairs[:, 1])), shape=(n_lbls + 1, n_lbls + 1))
+    _, comps      =  connected_components(graph, directed=False)                                                        # tile labels joined in frame labels
+    firsts        =  np.concatenate(firsts)
+    comp_firsts   =  np.full(comps.max() + 1, np.iinfo(np.int64).max)
+    np.minimum.at(comp_firsts, comps[1:], firsts[1:])                                                                   # first pixel (raster order) of each frame label
+    tags          =  np.zeros(comp_firsts.size, dtype=np.uint32)
+    tags[np.argsort(comp_firsts)]  =  np.arange(1, comp_firsts.size + 1, dtype=np.uint32)                               # tags in raster order, as label gives (the background component goes last)
+    lut           =  tags[comps]
+    lut[0]        =  0
+    return lut[lbls]
+
+
+def fill_small_holes(bw, area_thr, tile=None):
+    """Fill, in place, the holes of a 2D mask smaller than area_thr (strictly, as remove_small_holes of skimage 0.22); with tile holes are labeled tile by tile."""
+    holes           =  label(~bw, connectivity=1) if tile is None else label_tiled(~bw, tile)
+    small_holes     =  np.bincount(holes.ravel()) < area_thr
+    small_holes[0]  =  False
+    bw             |=  small_holes[holes]
+    return bw
+
+
+def work_buffer(buffers, name, shape, dtype):
+    """Matrix name of the given shape and dtype taken from buffers: allocated the first time, then reused by the following frames."""
+    key  =  (name, tuple(shape), np.dtype(dtype))
+    if key not in buffers:
+        buffers[key]  =  np.empty(shape, dtype=dtype)
+    return buffers[key]
+
+
+def smooth_threshold(bw_nucs, out):
+    """Gaussian smoothing (sigma .5) and Otsu threshold of a black&white mask, computed in bool.
+
+    The gaussian of a mask (kernel radius 2, positive weights) is positive
+    where the 5x5 neighbourhood touches the mask and Otsu on the two values
+    left gives back the same pixels: it is a 5x5 dilation (an empty mask
+    when a single value is left).
+    """
+    ndimage.binary_dilation(bw_nucs, structure=np.ones((5, 5), dtype=bool), output=out)
+    if out.all():
+        out[:]  =  False
+    return out
+
+
+def nuclei_mask(green_zxy, buffers=None):
+    """Minimum intensity projection and black&white mask of the nuclei of a single time frame (the z planes to work on).
+
+    Intermediate matrices are float32 or bool and work in place, taken from
+    buffers when given (the mask is one of them, copy it to keep it). The
+    hessian filter stays in float64: in float32 pixels close to the threshold
+    change.
+    """
+    if buffers is None:
+        buffers  =  {}
+    xlen, ylen        =  green_zxy.shape[1:]
+    green_bff         =  work_buffer(buffers, "green_bff", green_zxy.shape, np.float32)
+    green_bff[:]      =  green_zxy
+    ndimage.gaussian_filter(green_bff, 1.5, mode='nearest', output=green_bff)                                          # gaussian smoothing (same of skimage gaussian, in place)
+    green_minp        =  green_bff.min(0).astype(green_zxy.dtype)                                                       # minimum intensity projection over z
+    # green_minp        =  green_bff.sum(0)                                                                               # sum over z
+
+    bw_nucs  =  work_buffer(buffers, "bw_nucs", (xlen, ylen), bool)                                                     # black&white matrices
+    bw_bff   =  work_buffer(buffers, "bw_bff", (xlen, ylen), bool)
+    np.greater(hessian(green_minp.astype(np.float64)), .5, out=bw_nucs)                                                 # hessian filter to enhance the borders, for the way results is, the threshold is 0.5
+    fill_small_holes(bw_nucs, 100)                                                                                      # remove holes (TS makes holes in the nucleus calc)
+    smooth_threshold(bw_nucs, bw_bff)                                                                                   # gaussian filter to smooth (kernel .5 works) and otsu threshold
+    np.logical_not(bw_bff, out=bw_nucs)                                                                                 # image bw flip since borders are white
+    fill_small_holes(bw_nucs, 400)                                                                                      # remove the hole left by the TSs
+    closing(bw_nucs, disk(5), out=bw_bff)                                                                               # closure to make the smooth calcs borders
+    binary_erosion(bw_bff, disk(6), out=bw_nucs)                                                                        # erosion (here the purpouse is to sample inside nuclei, so if calcs are shrinked it is fine)
+
+    return green_minp, bw_nucs
+
+
+def nuclei_mask_tiled(green_zxy, tile, halo=48, buffers=None):
+    """Same of nuclei_mask working on tiles of the frame, to have the floating point intermediate matrices of the size of a tile.
+
+    Filters work on the tile plus halo (the gaussian and hessian filters reach
+    42 pixels, so results are the same of nuclei_mask for halo >= 42), holes
+    filling and threshold are computed on the whole frame.
+    """
+    if buffers is None:
+        buffers  =  {}
+    zlen, xlen, ylen  =  green_zxy.shape
+    green_minp        =  np.zeros((xlen, ylen), dtype=green_zxy.dtype)
+    bw_nucs           =  work_buffer(buffers, "bw_nucs", (xlen, ylen), bool)
+    bw_bff            =  work_buffer(buffers, "bw_bff", (xlen, ylen), bool)
+    tiles             =  tile_slices((xlen, ylen), tile, halo)
+    tile_bff          =  work_buffer(buffers, "tile_bff", (zlen, min(tile + 2 * halo, xlen), min(tile + 2 * halo, ylen)), np.float32)     # large enough for any tile plus halo
+    for out_sl, core_sl, in_sl in tiles:
+        green_bff            =  tile_bff[:, :out_sl[0].stop - out_sl[0].start, :out_sl[1].stop - out_sl[1].start]
+        green_bff[:]         =  green_zxy[:, out_sl[0], out_sl[1]]
+        ndimage.gaussian_filter(green_bff, 1.5, mode='nearest', output=green_bff)                                      # gaussian smoothing
+        minp_bff             =  green_bff.min(0).astype(green_zxy.dtype)                                                # minimum intensity projection over z
+        green_minp[core_sl]  =  minp_bff[in_sl]
+        bw_nucs[core_sl]     =  hessian(minp_bff.astype(np.float64))[in_sl] > .5                                        # hessian filter to enhance the borders, for the way results is, the threshold is 0.5
+
+    fill_small_holes(bw_nucs, 100, tile)                                                                                # remove holes (TS makes holes in the nucleus calc)
+    smooth_threshold(bw_nucs, bw_bff)                                                                                   # gaussian filter to smooth (kernel .5 works) and otsu threshold
+    np.logical_not(bw_bff, out=bw_nucs)                                                                                 # bw flip since borders are white
+    fill_small_holes(bw_nucs, 400, tile)                                                                                # remove the hole left by the TSs
+    for out_sl, core_sl, in_sl in tiles:
+        bw_bff[core_sl]  =  binary_erosion(closing(bw_nucs[out_sl], disk(5)), disk(6))[in_sl]                          # closure to make the smooth calcs borders and erosion (here the purpouse is to sample inside nuclei, so if calcs are shrinked it is fine)
+
+    return green_minp, bw_bff
+
+
+def frame_key(green_zxy, params):
+    """Fingerprint of the content of a frame (the z planes to work on) and of the segmentation parameters."""
+    fingerprint  =  hashlib.sha1(np.ascontiguousarray(green_zxy))
+    fingerprint.update(repr((green_zxy.shape, green_zxy.dtype.str, params)).encode())
+    return fingerprint.hexdigest()
+
+
+def detect_frame(green_zxy, tile=None, halo=48, lean=False):
+    """Segment the nuclei of a single time frame (the z planes to work on): output are the minimum intensity projection and the labeled nuclei.
+
+    With tile the frame is processed by tiles of tile x tile pixels (plus halo).
+    With lean the intermediate matrices are kept in WORK_BUFFERS and reused by
+    the next frames of the run instead of being allocated again.
+    """
+    buffers  =  WORK_BUFFERS if lean else {}
+    if tile is None:
+        green_minp, bw_nucs  =  nuclei_mask(green_zxy, buffers)
+        nucs_lbld            =  label(bw_nucs, connectivity=1).astype(np.uint32)                                        # label the nuclei (is a 2D labeling)
+    else:
+        green_minp, bw_nucs  =  nuclei_mask_tiled(green_zxy, tile, halo, buffers)
+        nucs_lbld            =  label_tiled(bw_nucs, tile)
+
+    areas                =  np.bincount(nucs_lbld.ravel())                                                          # area of each nucleus
+    to_work              =  areas > 800                                                                                 # threshold size for a nucleus to be correctly segmented (THIS PART CAN BE IMPROOVED WITH A GAUSSIAN FITTING ON THE HISTOGRAM OF THE AREAS DISTRIBUTION)
+    to_work[0]           =  False                                                                                       # lookup table of the nuclei to segment (2 or more touching)
+    bff2work             =  to_work[nucs_lbld]                                                                          # pixels of the nuclei to segment, selected in a single pass
+    nucs2work            =  np.where(bff2work, nucs_lbld, np.uint32(0))                                                 # matrix of the nuclei to work on (watershed)
+    nucs_lbld[bff2work]  =  0                                                                                           # remove the nuclei which segmentation must be correct from the segmented nuclei matrix
+
+    fin_bff  =  split_nuclei_cropped(nucs2work)                                                                         # watershed on the nuclei to correct only
+
+    kept       =  (areas > 0) & ~to_work
+    kept[0]    =  False
+    nucs_lbld  =  (np.cumsum(kept) * kept).astype(np.uint32)[nucs_lbld]                                                 # re-label segmented nuclei to avoid high tag values (lookup table, tags keep their order as label gives)
+    np.add(fin_bff, nucs_lbld.max() + 1, out=fin_bff, where=fin_bff > 0)                                               # tags of the just segmented nuclei after the others
+    nucs_lbld  +=  fin_bff                                                                                              # add the just segmented nuclei to the principal nuclei segmented matrix
+
+    small      =  np.bincount(nucs_lbld.ravel()) < 200                                                                  # pieces of nucleus oversegmented (low area)
+    small[0]   =  True
+    nucs_lbld  =  np.where(small, np.uint32(0), np.arange(small.size, dtype=np.uint32))[nucs_lbld]                     # are removed (lookup table)
+
+    return green_minp, nucs_lbld
+
+
+def invalidate(cache, frame_keys, frames):
+    """Remove the given frames (frame_keys are the keys of a run) from the cache, so that the next run segments them again."""
+    for tt in frames:
+        if tt < len(frame_keys):
+            cache.pop(frame_keys[tt], None)
+
+
+def detect_job(job_args, tile=None, halo=48, lean=False):
+    """Segment a frame of the series (job of the pool): output are the frame index and the results of detect_frame."""
+    tt, green_zxy  =  job_args
+    return tt, detect_frame(green_zxy, tile, halo, lean)
 
 
 class NucleiDetector:
-    """Only class, does all the job."""
-    def __init__(self, green4d):
+    """Only class, does all the job.
+
+    Frames are segmented by a pool of n_workers processes (None means all the
+    cores); progress(done, total) replaces the progress bar. tile and halo
+    filter each frame by tiles, lean reuses the intermediate matrices frame
+    after frame, cache (a dict) keeps a copy of the frames of the last run.
+    z_profile (TxZ) gives the z planes of each frame (ZSlab); with dist_thr the
+    nuclei are also tracked while the following frames are segmented.
+    """
+    def __init__(self, green4d, n_workers=1, progress=None, tile=None, halo=48, lean=False, cache=None, z_profile=None, dist_thr=None):
 
         tlen, zlen, xlen, ylen  =  green4d.shape                                                                        # shape of the input matrix
         green_minp              =  np.zeros((tlen, xlen, ylen), dtype=green4d.dtype)                                    # initialize the image-matrix for the intensity projection (sum in z)
+        nucs_lbld               =  np.zeros((tlen, xlen, ylen), dtype=np.uint32)                                        # initialize the matrix of labeled nuclei
+
+        pbar  =  None
+        if progress is None:                                                                                            # without a callback, progress is shown in a progress bar
+            pbar  =  UsefulWidgets.ProgressBar(total1=tlen)
+            pbar.show()
+            pbar.update_progressbar(0)
+
+            def progress(done, total):
+                pbar.update_progressbar(done)
+
+        z_slab      =  ZSlab.ZSlab(ZSlab.z_profile(green4d) if z_profile is None else z_profile)                    # z planes to work on, frame by frame (same of the analysis loader)
+        params      =  (tile, halo, lean)
+        frame_keys  =  [None] * tlen
+        ready       =  np.zeros(tlen, dtype=bool)                                                                       # frames segmented (or taken from the cache)
+
+        tracker         =  None
+        nuclei_tracked  =  None
+        tables          =  []
+        if dist_thr is not None:                                                                                        # nuclei are tracked while the following frames are segmented
+            tracker         =  NucleiConnect.NucleiTracker(dist_thr)
+            nuclei_tracked  =  np.zeros((tlen, xlen, ylen), dtype=np.int32)
+
+        def track_ready():
+            """Track, in time order, the frames ready."""
+            while tracker is not None and tracker.t < tlen and ready[tracker.t]:
+                tt                         =  tracker.t
+                nuclei_tracked[tt], table  =  tracker.track_frame(nucs_lbld[tt])
+                tables.append(table)
+
+        def store(result):
+            """Put a segmented frame in the output matrices (main thread only) and track the frames ready."""
+            tt, (minp_bff, lbld_bff)  =  result
+            green_minp[tt]            =  minp_bff
+            nucs_lbld[tt]             =  lbld_bff
+            ready[tt]                 =  True
+            track_ready()
+            progress(int(ready.sum()), tlen)
+
+        if n_workers is None:
+            n_workers  =  multiprocessing.cpu_count()
+        n_workers  =  min(n_workers, tlen)
+        job        =  partial(detect_job, tile=tile, halo=halo, lean=lean)
+        pool       =  multiprocessing.Pool(n_workers) if n_workers > 1 else None                                        # frames are independent: they are segmented in parallel
+        pending    =  collections.deque()                                                                               # frames sent to the pool, in time order
+        try:
+            for tt, green_zxy, _ in FrameSource.FrameSource(green4d, prefetch=True, z_range=z_slab.slabs):           # only the used z planes are read (and sent to the workers)
+                if cache is not None:
+                    frame_keys[tt]  =  frame_key(green_zxy, (tuple(z_slab.slabs[tt]),) + params)
+                    if frame_keys[tt] in cache:                                                                         # frames in the cache are not segmented again
+                        store((tt, cache[frame_keys[tt]]))
+                        continue
+                if pool is None:
+                    store(job((tt, green_zxy)))
+                    continue
+                pending.append(pool.apply_async(job, ((tt, green_zxy),)))
+                while len(pending) >= 2 * n_workers:                                                                    # at most two frames per worker are waiting: frames read ahead are bounded
+                    store(pending.popleft().get())
+            while pending:
+                store(pending.popleft().get())
+
+            progress(tlen, tlen)
+            if pool is not None:
+                pool.close()
+                pool.join()                                                                                             # worker processes exit, with their buffers
+        finally:
+            if pool is not None:
+                pool.terminate()                                                                                        # after an error the workers are stopped
+            WORK_BUFFERS.clear()                                                                                        # buffers of the serial path are not kept after the run
+            if pbar is not None:
+                pbar.close()
 
-        pbar  =  UsefulWidgets.ProgressBarTriple(total1=tlen, total2=tlen, total3=tlen)
-        pbar.show()
-        pbar.update_progressbar1(0)
-
-        mxxs  =  []
-        for tt in range(tlen):                                                                                          # for each time step
-            pbar.update_progressbar1(tt + 1)
-            # z_prof          =  np.sum(green4d[tt], axis=(1, 2))
-            # mxx             =  argrelextrema(z_prof, np.greater)[0]
-            # if mxx.size == 1:
-            #     mxx  =  np.array([0, mxx[0]])
-            # print(mxx)
-
-            # green_bff       =  gaussian(green4d[tt, mxx[0]:mxx[1]].astype(np.float32), 1.5)                                            # gaussian smoothing
-            mxx             =  [16, 20]
-            mxxs.append(mxx)
-            green_bff       =  gaussian(green4d[tt, mxx[0]:mxx[1]].astype(np.float32), 1.5)                                            # gaussian smoothing
-            green_minp[tt]  =  green_bff.min(0)                                                                         # sum over z
-            # green_minp[tt]  =  green_bff.sum(0)                                                                         # sum over z
-
-        bw_nucs  =  np.zeros((tlen, xlen, ylen), dtype=bool)                                                            # initialize the black&white video-matrix
-        for uu in range(tlen):                                                                                          # for each time frame
-            pbar.update_progressbar2(uu + 1)
-            bff          =  hessian(green_minp[uu])                                                                     # hessian filter to enhance the borders
-            bw_nucs[uu]  =  (bff > .5)                                                                                  # for the way results is, the threshold is 0.5
-            bw_nucs[uu]  =  remove_small_holes(bw_nucs[uu], 100)                                                        # remove holes (TS makes holes in the nucleus calc)
-            bw_nucs[uu]  =  gaussian(bw_nucs[uu].astype(float), .5)                                                     # gaussian filter to smooth (kernel .5 works)
-            val          =  threshold_otsu(bw_nucs[uu])                                                                 # otsu threshold on the gaussian filtered image
-            bw_nucs[uu]  =  (bw_nucs[uu] > val) * 1                                                                     # thresholding
-            bw_nucs[uu]  =  1 - bw_nucs[uu]                                                                             # image bw flip since borders are white
-            bw_nucs[uu]  =  remove_small_holes(bw_nucs[uu], 400)                                                        # remove the hole left by the TSs
-            bw_nucs[uu]  =  closing(bw_nucs[uu], disk(5))                                                               # closure to make the smooth calcs borders
-            bw_nucs[uu]  =  binary_erosion(bw_nucs[uu], disk(6))                                                        # erosion (here the purpouse is to sample inside nuclei, so if calcs are shrinked it is fine)
-
-        nucs_lbld  =  np.zeros(bw_nucs.shape, dtype=np.uint32)                                                          # initialize the matrix of labeled nuclei
-        for oo in range(tlen):                                                                                          # for each time frame
-            nucs_lbld[oo]  =  label(bw_nucs[oo], connectivity=1)                                                        # label frame by frame (is a 2D labeling)
-
-        nucs2work  =  np.zeros_like(nucs_lbld)                                                                          # initialize the matrix of the nuclei to work on (watershed)
-        # areas_list  =  []
-        for yy in range(tlen):                                                                                          # for each time frame
-            rgp_bff  =  regionprops_table(nucs_lbld[yy], properties=("label", "area"))                                  # regionpros of the nuclei
-            gg       =  np.where(rgp_bff["area"] > 800)[0]                                                              # threshold size for a nucleus to be correctly segmented (THIS PART CAN BE IMPROOVED WITH A GAUSSIAN FITTING ON THE HISTOGRAM OF THE AREAS DISTRIBUTION)
-            for gg_s in gg:                                                                                             # all nuclei with a surface higher than the threshold are nuclei to segment (2 or more touching
-                nucs2work[yy]  +=  (nucs_lbld[yy] == rgp_bff["label"][gg_s]) * np.uint32(rgp_bff["label"][gg_s])        # add the nuclei to segment into the matrix nucs2work
-            # areas_list  +=  list(rgp_bff["area"])
-
-        nucs_lbld  *=  (1 - np.sign(nucs2work))                                                                         # remove the nuclei which segmentation must be correct from the segmented nuclei matrix
-
-        for hh in range(tlen):                                                                                          # for each time frame
-            pbar.update_progressbar3(hh + 1)
-            nucs_bff      =  binary_erosion(np.sign(nucs2work[hh])) * nucs2work[hh]                                     # binary erosion of the nuclei to correct to reduce the errors (strange shapes can lead to bad segmentation)
-            distance      =  ndimage.distance_transform_edt(nucs_bff)                                                   # distance matrix for the watershed
-            l_maxi_crd    =  peak_local_max(distance, footprint=np.ones((7, 7)), labels=label(nucs_bff))                # search the local maxima (this is a list of coordinates)
-            local_maxi    =  np.zeros((xlen, ylen), dtype=np.uint8)                                                     # local maxima as a matrix, initialization
-            for ll in l_maxi_crd:
-                local_maxi[ll[0], ll[1]]  =  1                                                                          # put 1 in corrispondence of the peaks
-            local_mx      =  gaussian(local_maxi, 1) > 0                                                                # gaussian blurring for the local maxima matrix to avoid to ahve 2 very close peaks
-            local_mx_lbl  =  label(local_mx, connectivity=1).astype(np.int32)                                           # label of the local maxima matrix
-            local_mx_rgp  =  regionprops_table(local_mx_lbl, properties=["centroid"])                                   # regionprops to extract the centroisd
-
-            ctrs_mx       =  np.zeros((xlen, ylen))                                                                     # initialize centroids matrix
-            for cnt, jj in enumerate(local_mx_rgp["centroid-0"]):
-                ctrs_mx[np.round(jj).astype(np.int32), np.round(local_mx_rgp['centroid-1'][cnt]).astype(np.int32)]  =  1    # put 1 in corrispondence of the peaks
-            markers       =  label(ctrs_mx)                                                                             # markers matrix
-            fin_bff       =  watershed(-distance, markers, mask=np.sign(nucs2work[hh]))                                 # finally watershed
-
-            nucs_lbld[hh]  =  label(nucs_lbld[hh]).astype(np.uint32)                                                    # re-label segmented nuclei to avoid high tag values
-            nucs_lbld[hh]  =  nucs_lbld[hh] + ((nucs_lbld[hh].max() + 1) * np.sign(fin_bff) + fin_bff).astype(np.uint32)    # add the just segmented nuclei to the principal nuclei segmented matrix
-
-            rgp_bff2  =  regionprops_table(nucs_lbld[hh], properties=["label", "area"])                                 # regionprops of the principal nuclei segmented matrix
-            iis2work  =  np.where(rgp_bff2["area"] < 200)[0]                                                            # search for the nuclei with low area
-            # ant = np.zeros(nucs_lbld[hh].shape)
-            for jj in iis2work:                                                                                         # for all the small area nuclei (here we implement the idea that a peice of nucleus oversegmented must be joined to the nucleus with which it shares more border)
-                bff_img   =  (nucs_lbld[hh] == rgp_bff2["label"][jj]) * rgp_bff2["label"][jj]                           # isolate the calc
-                # ant += bff_img
-                nuc_bff   =  np.sign(expand_labels(bff_img)) - np.sign(bff_img)                                         # expand the calc and remove it from the expantion in order to have the external border of the calc only
-                nuc_bff   =  nuc_bff.astype(np.uint32) * nucs_lbld[hh]                                                  # check the tags in the external contour to find the tags of touching nuclei
-                if np.isnan(np.median(nuc_bff)):                                                                        # if the matrix is empty (nucleus does not touch anything) the median filter gives nan and there is nothing to do (those are generally pieces of nuclei touching the border)
-                    pass
-                if np.median(nuc_bff) - np.fix(np.median(nuc_bff)) != 0:                                                # in case you have the same number of pixels in the external contour for 2 tags, you will have a decimal number as result
-                    nuc_bff  =  nuc_bff[0]                                                                              # chose the smaller tag: this is comletely arbitrary, but we don't have anything wiser
-                elif np.median(nuc_bff) - np.fix(np.median(nuc_bff)) == 0:                                              # if the median gives an integer value, means that there is a tag that is more present than the other(s)
-                    nuc_bff  =  np.median(nuc_bff)                                                                      # we take this tag as reference
-
-                nucs_lbld[hh]  *=  (1 - np.sign(bff_img)).astype(np.uint32)                                             # remove the calc from the principal nuclei segmented matrix
-                nucs_lbld[hh]  +=  np.sign(bff_img).astype(np.uint32) * np.uint32(nuc_bff)                              # add the small calc to the matrix with the proper tag
-
-        pbar.close()
-
-        mxxs      =  np.asarray(mxxs)
-        z_ref     =  mxxs.mean(0)
-        z_ref[0]  =  np.round(z_ref[0])
-        z_ref[1]  =  np.round(z_ref[1])
+        if cache is not None:                                                                                           # the cache keeps a copy of the frames of the last run only: at most one green_minp and one nucs_lbld
+            cache.clear()
+            cache.update({frame_keys[tt]: (green_minp[tt].copy(), nucs_lbld[tt].copy()) for tt in range(tlen)})
 
         self.nucs_lbld   =  nucs_lbld
         self.green_minp  =  green_minp
-        self.z_ref       =  z_ref.astype(int)
+        self.z_ref       =  z_slab.z_ref
+        self.z_slabs     =  z_slab.slabs
+        self.frame_keys  =  frame_keys
+        if tracker is not None:
+            self.nuclei_tracked  =  nuclei_tracked
+            self.track_table     =  TrackTable.concatenate(tables)
 
 
 
@@ -1,4 +1,7 @@
-"""Given tracked spots and tracked nuclei, this function generates the false colored video."""
+"""Given tracked spots and tracked nuclei, this function generates the false colored video.
+
+With the track table of the nuclei, each nucleus is searched only inside its bounding box.
+"""
 
 import numpy as np
 from skimage.measure import label, regionprops_table
@@ -8,7 +11,7 @@ from PyQt5 import QtWidgets
 
 class NucleiSpotsConnection:
     """Only one clss, does all the job"""
-    def __init__(self, spots_tracked, nuclei_tracked):
+    def __init__(self, spots_tracked, nuclei_tracked, track_table=None):
 
         nuclei_active  =  np.sign(nuclei_tracked).astype(int)
         idx            =  np.unique(spots_tracked)[1:]                                                             # list of all the values in the spots matrix. The zero, which is the first, is removed
@@ -25,8 +28,14 @@ class NucleiSpotsConnection:
             coord_idx  =  np.where(rgp_spts["label"] == k)[0][0]                    # search the dictionary location with the corresponding label, generally is k + 1, but like this is 100% sure
             t_steps    =  np.unique(rgp_spts["coords"][coord_idx][:, 0])            # array with the t coordinate of each pixel of the spot tracked. np.unique to have only once the number of the frame in which the            i  +=  1
             i         +=  1
-            for tt in t_steps:
-                nuclei_active[tt, :, :]  +=  (nuclei_tracked[tt, :, :] == k)
+            if track_table is None:
+                for tt in t_steps:
+                    nuclei_active[tt, :, :]  +=  (nuclei_tracked[tt, :, :] == k)
+            else:
+                rows  =  track_table.rows_track(k)
+                for j in rows[np.isin(track_table.t[rows], t_steps)]:                     # bounding boxes of the nucleus k in the frames of the spot
+                    tt, (x0, y0, x1, y1)              =  track_table.t[j], track_table.bbox[j]
+                    nuclei_active[tt, x0:x1, y0:y1]  +=  (nuclei_tracked[tt, x0:x1, y0:y1] == k)
 
         pbar.close()
 
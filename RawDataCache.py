@@ -0,0 +1,97 @@
+"""This function loads raw data through a persistent cache on disk.
+
+Decoding .czi files takes minutes per embryo: the decoded and rotated 4D
+matrices and their maximum intensity projections are stored as .npy files
+in a cache folder and re-opened as memory maps, so reopening an analysis is
+almost instantaneous. Entries are keyed by path, size and modification time
+of the raw data files plus the channel selection and the frame range; when
+the cache exceeds its maximum size the least recently used entries are
+removed. The z profile of the green channel is stored with the matrices.
+Inputs and outputs are the same of MultiLoadCzi5D.
+"""
+
+
+import os
+import shutil
+import hashlib
+import numpy as np
+
+import MultiLoadCzi5D
+
+
+CACHE_FOLDER    =  os.path.join(os.path.expanduser("~"), ".LlamaNucleiHoles_cache")
+CACHE_MAX_SIZE  =  50 * 1024 ** 3                                                                   # bytes
+MTX_NAMES       =  ["imarray_red", "imarray_green", "green4d", "red4d"]
+
+
+def cache_key(fnames, nucs_spts_ch, frame_range=None):
+    """Fingerprint of the raw data files (path, size, modification time), channel selection and frame range."""
+    fingerprint  =  hashlib.sha1()
+    for fname in fnames:
+        fstat  =  os.stat(fname)
+        fingerprint.update((os.path.abspath(fname) + "|" + str(fstat.st_size) + "|" + str(fstat.st_mtime_ns) + "\n").encode())
+    fingerprint.update(str([int(ch) for ch in nucs_spts_ch]).encode())
+    if frame_range is not None:
+        fingerprint.update(str([int(ff) for ff in frame_range]).encode())
+    return fingerprint.hexdigest()
+
+
+def folder_size(folder):
+    """Size in bytes of the files in a folder."""
+    return sum(os.path.getsize(os.path.join(folder, ff)) for ff in os.listdir(folder))
+
+
+def evict(cache_folder, max_size, keep=None):
+    """Remove the least recently used entries until the cache is smaller than max_size (the entry keep is never removed)."""
+    entries  =  [os.path.join(cache_folder, ee) for ee in os.listdir(cache_folder) if not ee.startswith(".")]
+    entries  =  sorted(entries, key=os.path.getmtime)                                               # entry folders are touched at each use: oldest first
+    sizes    =  [folder_size(ee) for ee in entries]
+    tot      =  sum(sizes)
+    for entry, size in zip(entries, sizes):
+        if tot <= max_size:
+            break
+        if os.path.basename(entry) != keep:
+            shutil.rmtree(entry, ignore_errors=True)
+            tot  -=  size
+
+
+class RawDataCache:
+    """Only class, does all the job."""
+    def __init__(self, fnames, nucs_spts_ch, frame_range=None, cache_folder=CACHE_FOLDER, max_size=CACHE_MAX_SIZE):
+
+        os.makedirs(cache_folder, exist_ok=True)
+        key    =  cache_key(fnames, nucs_spts_ch, frame_range)
+        entry  =  os.path.join(cache_folder, key)
+
+        if not os.path.isfile(os.path.join(entry, "z_profile.npy")):                                # cache miss: decode raw data and write the entry
+            shutil.rmtree(entry, ignore_errors=True)
+            raw_data  =  MultiLoadCzi5D.MultiLoadCzi5D(fnames, nucs_spts_ch, frame_range=frame_range)
+            tmp       =  os.path.join(cache_folder, "." + key)                                      # written in a hidden folder and then renamed, so an interrupted writing never leaves a broken entry
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            for mtx_name in MTX_NAMES:
+                mtx  =  getattr(raw_data, mtx_name)
+                mm   =  np.lib.format.open_memmap(os.path.join(tmp, mtx_name + ".npy"), mode="w+", dtype=mtx.dtype, shape=mtx.shape)
+                for t in range(mtx.shape[0]):                                                       # written frame by frame: no extra full size copy of the (rotated) matrices
+                    mm[t]  =  mtx[t]
+                mm.flush()
+                del mm
+            info  =  np.array([raw_data.time_steps, raw_data.pix_size_x, raw_data.pix_size_z, raw_data.time_step_value, raw_data.first_last_frame[0], raw_data.first_last_frame[1]], dtype=float)   # None becomes nan
+            np.save(os.path.join(tmp, "info.npy"), info)
+            np.save(os.path.join(tmp, "z_profile.npy"), raw_data.z_profile)
+            os.rename(tmp, entry)
+            del raw_data
+
+        os.utime(entry)                                                                             # mark the entry as recently used
+        evict(cache_folder, max_size, keep=key)
+
+        info  =  np.load(os.path.join(entry, "info.npy"))
+        for mtx_name in MTX_NAMES:
+            setattr(self, mtx_name, np.load(os.path.join(entry, mtx_name + ".npy"), mmap_mode="r"))
+        self.z_profile  =  np.load(os.path.join(entry, "z_profile.npy"))
+
+        self.time_steps        =  int(info[0])
+        self.first_last_frame  =  info[4:6].astype(int)
+        self.pix_size_x        =  None if np.isnan(info[1]) else info[1]
+        self.pix_size_z        =  None if np.isnan(info[2]) else info[2]
+        self.time_step_value   =  None if np.isnan(info[3]) else info[3]
@@ -2,45 +2,84 @@
 
 Given a time series of already tracked nuclei, this function check the nuclei that
 appear even ones on the border of the images and removes them.
-
+Border nuclei are found in the border strips only (px_brd thick) and removed
+with a single lookup table pass (LabelsRemap), in place. With the track
+table of the nuclei, border nuclei are found from the bounding boxes and
+removed inside their bounding boxes only; the table is updated too.
+RemoveSmallNuclei can work on the frames in a pool of processes.
 """
 
 
+import multiprocessing
+from functools import partial
 import numpy as np
 from skimage.morphology import remove_small_objects
 # from PyQt5 import QtWidgets
 
-import UsefulWidgets
+import LabelsRemap
+
+
+def remove_small_frame(nucs, area_thr):
+    """Remove the nuclei smaller than area_thr from a frame (job of the pool)."""
+    return remove_small_objects(nucs, area_thr)
 
 
 class RemoveBorderNuclei:
-    def __init__(self, nuclei_tracked, px_brd):
+    def __init__(self, nuclei_tracked, px_brd, track_table=None):
 
-        mask                                     =  np.ones(nuclei_tracked.shape, dtype='uint16')        # B&W matrix, having 1 on the border (px_brd thick)
-        mask[:, px_brd:-px_brd, px_brd:-px_brd]  =  0
-        idxs_rmv                                 =  np.unique(mask * nuclei_tracked)[1:]                 # multiplication of the matrix with image to have the indexes of the nuclei touching the border
+        if track_table is not None:
+            self.remove_from_table(nuclei_tracked, px_brd, track_table)
+            return
 
-        pbar  =  UsefulWidgets.ProgressBar(total1=idxs_rmv.size)
-        pbar.show()
-        pbar_idx  =  1
+        if px_brd > 0:
+            strips  =  [nuclei_tracked[:, :px_brd], nuclei_tracked[:, -px_brd:], nuclei_tracked[:, :, :px_brd], nuclei_tracked[:, :, -px_brd:]]     # the border, px_brd thick
+        else:
+            strips  =  [nuclei_tracked]                                                                 # with px_brd = 0 everything is border (as it has always been)
+        idxs_rmv  =  np.unique(np.concatenate([np.unique(strip) for strip in strips]))                  # indexes of the nuclei touching the border
+        idxs_rmv  =  idxs_rmv[idxs_rmv > 0]
 
-        for k in idxs_rmv:
-            pbar.update_progressbar(pbar_idx)
-            pbar_idx       +=  1
-            nuclei_tracked  *=  (1 - (nuclei_tracked == k)).astype('bool')                                                  # removal of all these nuclei
+        lut  =  LabelsRemap.drop_lut(nuclei_tracked.max(initial=0), idxs_rmv, nuclei_tracked.dtype)          # removal of all these nuclei, in place
+        LabelsRemap.remap(nuclei_tracked, lut, out=nuclei_tracked)
 
-        pbar.close()    
+        self.nuclei_tracked  =  nuclei_tracked
+        self.track_table     =  None
+
+    def remove_from_table(self, nuclei_tracked, px_brd, track_table):
+        """Find border nuclei from the bounding boxes of the track table and remove them inside the boxes."""
+        x_len, y_len  =  nuclei_tracked.shape[1:]
+        bbox          =  track_table.bbox
+        if px_brd > 0:                                                                                  # rows or columns [0, px_brd) and [len - px_brd, len) are border
+            on_brd  =  (bbox[:, 0] < px_brd) | (bbox[:, 1] < px_brd) | (bbox[:, 2] > x_len - px_brd) | (bbox[:, 3] > y_len - px_brd)
+        else:
+            on_brd  =  np.ones(len(track_table), dtype=bool)                                            # with px_brd = 0 everything is border
+        idxs_rmv  =  np.unique(track_table.track_id[on_brd])
+
+        for j in np.where(np.isin(track_table.track_id, idxs_rmv))[0]:
+            t, (x0, y0, x1, y1)                    =  track_table.t[j], track_table.bbox[j]
+            crop                                   =  nuclei_tracked[t, x0:x1, y0:y1]
+            crop[crop == track_table.track_id[j]]  =  0
 
         self.nuclei_tracked  =  nuclei_tracked
+        self.track_table     =  track_table.drop(idxs_rmv)
 
 
 class RemoveSmallNuclei:
-    def __init__(self, nuclei_tracked, area_thr):
+    """Remove the nuclei smaller than area_thr, frame by frame: with n_workers > 1 (None means all the cores) frames are processed by a pool of processes."""
+    def __init__(self, nuclei_tracked, area_thr, n_workers=1):
 
         steps        =  nuclei_tracked.shape[0]
         nuclei_thrd  =  np.zeros_like(nuclei_tracked)
 
-        for t in range(steps):
-            nuclei_thrd[t]  =  remove_small_objects(nuclei_tracked[t], area_thr)
+        if n_workers is None:
+            n_workers  =  multiprocessing.cpu_count()
+        n_workers  =  min(n_workers, steps)
+
+        if n_workers > 1:                                                                               # frames are independent, results come back in order
+            with multiprocessing.Pool(n_workers) as pool:
+                for t, nucs_thrd in enumerate(pool.imap(partial(remove_small_frame, area_thr=area_thr), nuclei_tracked, chunksize=max(1, steps // (4 * n_workers)))):
+                    nuclei_thrd[t]  =  nucs_thrd
+        else:
+            for t in range(steps):
+                nuclei_thrd[t]  =  remove_small_frame(nuclei_tracked[t], area_thr)
 
         self.nuclei_thrd  =  nuclei_thrd
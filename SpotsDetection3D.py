@@ -11,6 +11,7 @@ from scipy.stats import norm
 from skimage.measure import label, regionprops  # , regionprops_table
 
 import SpotsDetectionUtility
+import FrameSource
 
 
 class SpotsDetection3D:
@@ -31,9 +32,8 @@ class SpotsDetection3D:
         # spots_lbls    =  np.zeros((steps, zlen, xlen, ylen), dtype=np.int16)
         spots_tzxy    =  np.zeros((0, 4), dtype=np.int16)
 
-        for t in range(steps):
+        for t, g21, _ in FrameSource.FrameSource(green4d, prefetch=True):                 # for each time step, we Gaussian filter the 3D stack (x-y-z) and then Laplacian filter
             # print(t)
-            g21          =  green4d[t, :, :, :]                                           # for each time step, we Gaussian filter the 3D stack (x-y-z) and then Laplacian filter
             g21g         =  filters.gaussian_filter(g21, gauss_kernelsize_value)
             g21f         =  filters.laplace(g21g.astype(float))
             (mu, sigma)  =  norm.fit(np.abs(g21f))                                        # histogram is fitted with a Gaussian function
@@ -0,0 +1,103 @@
+"""This function stores the tracked nuclei in a table.
+
+Each row of the table is a tracked nucleus in a time frame: track tag, time
+frame, centroid, area, bounding box and tag of the nucleus in the segmented
+frame (one numpy array per column). Rows are sorted by time frame and track
+tag, with an index by track, so the nuclei of a track are found without
+scanning the label movie. The table is saved next to nuclei_tracked.npy, in
+nuclei_tracks.npz.
+"""
+
+
+import os
+import numpy as np
+from skimage.measure import regionprops_table
+
+
+FNAME    =  "/nuclei_tracks.npz"
+COLUMNS  =  ["track_id", "t", "ctrs", "area", "bbox", "label"]
+
+
+def frame_table(trck_frame, lbld_frame, tt):
+    """Table of a frame of the tracked nuclei (lbld_frame, the segmented frame, gives the frame tags; it can be None)."""
+    props  =  ["label", "centroid", "area", "bbox"] + (["intensity_max"] if lbld_frame is not None else [])
+    rgp    =  regionprops_table(trck_frame, intensity_image=lbld_frame, properties=props)
+    return TrackTable({"track_id": rgp["label"].astype(np.int32),
+                       "t": np.full(rgp["label"].size, tt, dtype=np.int32),
+                       "ctrs": np.stack([rgp["centroid-0"], rgp["centroid-1"]], axis=1).reshape(-1, 2),
+                       "area": rgp["area"].astype(np.int64),
+                       "bbox": np.stack([rgp["bbox-" + str(k)] for k in range(4)], axis=1).astype(np.int32).reshape(-1, 4),
+                       "label": rgp["intensity_max"].astype(np.int32) if lbld_frame is not None else np.zeros(rgp["label"].size, dtype=np.int32)})
+
+
+def from_movie(nuclei_tracked, nuclei_lbld=None):
+    """Table of a movie of tracked nuclei (nuclei_lbld, the segmented movie, gives the frame tags)."""
+    return concatenate([frame_table(nuclei_tracked[tt], None if nuclei_lbld is None else nuclei_lbld[tt], tt) for tt in range(nuclei_tracked.shape[0])])
+
+
+def concatenate(tables):
+    """Single table with the rows of all the tables."""
+    return TrackTable({col: np.concatenate([getattr(tbl, col) for tbl in tables]) for col in COLUMNS})
+
+
+def load(analysis_folder, nuclei_tracked, nuclei_lbld=None):
+    """Load the table of an analysis; analysis saved without table get it from the movie of the tracked nuclei."""
+    if os.path.isfile(analysis_folder + FNAME):
+        with np.load(analysis_folder + FNAME) as fl:
+            return TrackTable({col: fl[col] for col in COLUMNS})
+    return from_movie(nuclei_tracked, nuclei_lbld)
+
+
+class TrackTable:
+    """Table of the tracked nuclei, with the index by track."""
+    def __init__(self, cols):
+
+        order  =  np.lexsort((cols["track_id"], cols["t"]))                                        # rows sorted by frame, then by track
+        for col in COLUMNS:
+            setattr(self, col, cols[col][order])
+
+        self.trk_order                   =  np.argsort(self.track_id, kind="stable")               # index by track: rows of each track, in time order
+        self.track_ids, self.trk_starts  =  np.unique(self.track_id[self.trk_order], return_index=True)
+        self.trk_starts                  =  np.append(self.trk_starts, self.track_id.size)
+
+    def __len__(self):
+        return self.track_id.size
+
+    def rows_track(self, k):
+        """Rows of the track k, in time order."""
+        j  =  np.searchsorted(self.track_ids, k)
+        if j == self.track_ids.size or self.track_ids[j] != k:
+            return np.zeros(0, dtype=np.int64)
+        return self.trk_order[self.trk_starts[j]:self.trk_starts[j + 1]]
+
+    def drop(self, ids):
+        """Table without the tracks in ids."""
+        keep  =  ~np.isin(self.track_id, ids)
+        return TrackTable({col: getattr(self, col)[keep] for col in COLUMNS})
+
+    def remap(self, lut, t_offset=0):
+        """Table with the tracks relabeled by the lookup table lut (and time frames shifted by t_offset).
+
+        Tracks going to 0 are dropped, rows of tracks joined in the same frame
+        are merged (areas summed, centroids weighted by area, bounding boxes
+        joined, largest frame tag, as found by frame_table on the relabeled frame).
+        """
+        ids     =  lut[self.track_id]
+        keep    =  ids > 0
+        cols    =  {col: getattr(self, col)[keep] for col in COLUMNS}
+        cols["track_id"], cols["t"]  =  ids[keep].astype(np.int32), cols["t"] + np.int32(t_offset)
+
+        order   =  np.lexsort((cols["track_id"], cols["t"]))
+        cols    =  {col: cols[col][order] for col in COLUMNS}
+        strts   =  np.where(np.append(True, (np.diff(cols["t"]) != 0) | (np.diff(cols["track_id"]) != 0)))[0]     # first row of each (frame, track) couple
+        if strts.size < order.size:
+            area           =  np.add.reduceat(cols["area"], strts)
+            cols["ctrs"]   =  np.add.reduceat(cols["ctrs"] * cols["area"][:, None], strts) / area[:, None]
+            cols["bbox"]   =  np.concatenate([np.minimum.reduceat(cols["bbox"][:, :2], strts), np.maximum.reduceat(cols["bbox"][:, 2:], strts)], axis=1)
+            cols["label"]  =  np.maximum.reduceat(cols["label"], strts)
+            cols["area"], cols["track_id"], cols["t"]  =  area, cols["track_id"][strts], cols["t"][strts]
+        return TrackTable(cols)
+
+    def save(self, analysis_folder):
+        """Save the table in the analysis folder."""
+        np.savez(analysis_folder + FNAME, **{col: getattr(self, col) for col in COLUMNS})
@@ -0,0 +1,33 @@
+"""This function chooses the z planes to work on for the nuclei detection.
+
+Input is the z profile of the green channel (TxZ matrix, the sum of each z
+plane of each frame, computed once while loading raw data). In each frame
+nuclei are between the two maxima of the profile: that is the slab [first,
+last) of the frame. Frames without exactly two maxima take the mean slab of
+the others (z_ref), or the default one when no frame has two maxima.
+NucleiDetector and the analysis loader use the same slabs, so they always
+work on the same planes.
+"""
+
+
+import numpy as np
+from scipy.signal import argrelextrema
+
+import FrameSource
+
+
+def z_profile(green4d):
+    """Sum of each z plane of each frame (TxZ), read frame by frame: used only when the profile was not computed while loading."""
+    return np.array([green_zxy.sum(axis=(1, 2)) for tt, green_zxy, _ in FrameSource.FrameSource(green4d, prefetch=True)])
+
+
+class ZSlab:
+    """Only class, does all the job."""
+    def __init__(self, z_prof, default=(16, 20)):
+
+        mxxs   =  [argrelextrema(prof, np.greater)[0] for prof in z_prof]                                # maxima of the z profile of each frame
+        valid  =  np.array([mxx for mxx in mxxs if mxx.size == 2]).reshape(-1, 2)
+        z_ref  =  np.round(valid.mean(0)).astype(int) if valid.shape[0] > 0 else np.array(default)
+
+        self.slabs  =  np.array([mxx if mxx.size == 2 else z_ref for mxx in mxxs]).reshape(-1, 2)       # [first, last) z plane of each frame
+        self.z_ref  =  z_ref
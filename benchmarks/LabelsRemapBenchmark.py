@@ -0,0 +1,80 @@
+"""Timing of LabelsRemap against the per-label loops it replaced.
+
+Run from the repository root: python benchmarks/LabelsRemapBenchmark.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import LabelsRemap
+
+
+def timed(func, *args):
+    """Output and seconds of func(*args)."""
+    t0   =  time.perf_counter()
+    res  =  func(*args)
+    return res, time.perf_counter() - t0
+
+
+def prune_loop(spots_tracked, tlen):
+    """Short tracks pruning as BackgroundEstimateFillingGaps did."""
+    for spt_tag in np.unique(spots_tracked[spots_tracked != 0]):
+        sing_spt  =  spots_tracked == spt_tag
+        if (np.sum(np.sign(np.sum(sing_spt, axis=(1, 2)))) / tlen) < 0.2:
+            spots_tracked  *=  (1 - sing_spt).astype(np.uint32)
+    return spots_tracked
+
+
+def prune_lut(spots_tracked, tlen):
+    """Short tracks pruning with frames_count and one in place drop."""
+    shorts  =  np.where((LabelsRemap.frames_count(spots_tracked) / tlen) < 0.2)[0]
+    return LabelsRemap.remap(spots_tracked, LabelsRemap.drop_lut(spots_tracked.max(), shorts, spots_tracked.dtype), out=spots_tracked)
+
+
+def drop_loop(lbls, ids):
+    """Removal of the tags one by one, as RemoveBorderNuclei did."""
+    for k in ids:
+        lbls  *=  (1 - (lbls == k)).astype(bool)
+    return lbls
+
+
+def drop_remap(lbls, ids):
+    """Removal of the tags with one lookup table."""
+    return LabelsRemap.remap(lbls, LabelsRemap.drop_lut(lbls.max(), ids, lbls.dtype), out=lbls)
+
+
+def merge_loop(lbls, groups):
+    """Join of each group of tags, one mask per tag, as LabelsModify did."""
+    for idxs in groups:
+        labels_mask  =  np.zeros(lbls.shape)
+        for l in idxs:
+            labels_mask  +=  (lbls == l).astype(np.int32)
+        lbls  =  lbls * (1 - labels_mask) + idxs[0] * labels_mask
+    return lbls
+
+
+def merge_remap(lbls, groups):
+    """Join of all the groups with one lookup table."""
+    return LabelsRemap.remap(lbls, LabelsRemap.merge_lut(lbls.max(), groups))
+
+
+if __name__ == "__main__":
+    rng  =  np.random.default_rng(0)
+
+    spots  =  np.zeros((40, 256, 256), dtype=np.uint32)                                     # 300 spots living 1 to 40 frames
+    for k in range(1, 301):
+        t0, x0, y0                                                =  rng.integers(0, 40), rng.integers(0, 250), rng.integers(0, 250)
+        spots[t0:t0 + rng.integers(1, 41), x0:x0 + 4, y0:y0 + 4]  =  k
+    lbls    =  rng.integers(0, 400, (20, 512, 512)).astype(np.int32)
+    ids     =  rng.choice(np.arange(1, 400), 20, replace=False)
+    groups  =  [list(rng.choice(np.arange(1, 400), 2, replace=False)) for k in range(10)]
+
+    for name, old, new, args in [["pruning 40x256x256, 300 spots", prune_loop, prune_lut, (spots, 40)],
+                                 ["drop 20 tags, 20x512x512", drop_loop, drop_remap, (lbls, ids)],
+                                 ["merge 10 pairs, 20x512x512", merge_loop, merge_remap, (lbls, groups)]]:
+        res_old, t_old  =  timed(old, args[0].copy(), args[1])
+        res_new, t_new  =  timed(new, args[0].copy(), args[1])
+        print("%-32s loop %7.3f s   lut %7.3f s   x%-7.1f same output: %s" % (name, t_old, t_new, t_old / t_new, np.array_equal(res_old, res_new)))
@@ -0,0 +1,42 @@
+"""Timing of the maximum intensity projection of LoadCzi5D against the loop it replaced.
+
+Run from the repository root: python benchmarks/LoadCzi5DBenchmark.py
+Only the projection step is timed, on a synthetic (c, t, z, x, y) matrix as
+the one decoded from a .czi file.
+"""
+
+import time
+import numpy as np
+
+
+def timed(func, *args):
+    """Output and seconds of func(*args)."""
+    t0   =  time.perf_counter()
+    res  =  func(*args)
+    return res, time.perf_counter() - t0
+
+
+def mip_loop(file_array):
+    """Projection one time step and one row at a time, as LoadCzi5D did."""
+    steps, x_len, y_len  =  file_array.shape[1], file_array.shape[3], file_array.shape[4]
+    red_mtx              =  np.zeros((steps, x_len, y_len), dtype=np.int32)
+    green_mtx            =  np.zeros((steps, x_len, y_len), dtype=np.int32)
+    for t in range(steps):
+        for x in range(x_len):
+            red_mtx[t, x, :]    =  file_array[0, t, :, x, :].max(0)
+            green_mtx[t, x, :]  =  file_array[1, t, :, x, :].max(0)
+    return np.stack([red_mtx, green_mtx])
+
+
+def mip_vect(file_array):
+    """Projection of all the channels and time steps with one reduction along z."""
+    return file_array.max(axis=2)
+
+
+if __name__ == "__main__":
+    rng         =  np.random.default_rng(0)
+    file_array  =  rng.integers(0, 4096, (2, 10, 40, 512, 512), dtype=np.uint16)          # 2 channels, 10 time steps, 40 z planes
+
+    res_old, t_old  =  timed(mip_loop, file_array)
+    res_new, t_new  =  timed(mip_vect, file_array)
+    print("%-32s loop %7.3f s   vect %7.3f s   x%-7.1f same output: %s" % ("mip 2x10x40x512x512", t_old, t_new, t_old / t_new, np.array_equal(res_old, res_new)))
@@ -0,0 +1,65 @@
+"""Memory of the steps following MultiLoadCzi5D, with the former rotated views and with the transposed decoding.
+
+Run from the repository root: python benchmarks/MultiLoadCzi5DBenchmark.py
+Planes are synthetic tiles, decoded as read_planes does; the downstream step
+is the one of the analysis: contiguous green 4D matrix, red frames flattened
+to vectors and a float32 gaussian on some planes. Peaks come from tracemalloc.
+"""
+
+import time
+import tracemalloc
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+
+def traced(func, *args):
+    """Output, peak MB and seconds of func(*args)."""
+    tracemalloc.start()
+    t0        =  time.perf_counter()
+    res       =  func(*args)
+    t1        =  time.perf_counter()
+    _, peak   =  tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return res, peak / 1e6, t1 - t0
+
+
+def decode(tiles, transpose):
+    """Write (x, y) tiles into a (t, z, x, y) matrix, or transposed into a (t, z, y, x) one."""
+    t_len, z_len, x_len, y_len  =  tiles.shape
+    mtx                         =  np.zeros((t_len, z_len, y_len, x_len) if transpose else tiles.shape, dtype=tiles.dtype)
+    for t in range(t_len):
+        for z in range(z_len):
+            mtx[t, z]  =  tiles[t, z].T if transpose else tiles[t, z]
+    return mtx
+
+
+def orient_rot90(mtx):
+    """ImageJ orientation as MultiLoadCzi5D gave it before: a rotated and flipped view."""
+    return np.rot90(mtx, axes=(2, 3))[:, :, ::-1, :]
+
+
+def downstream(green4d, red4d):
+    """Analysis step needing contiguous matrices."""
+    green  =  np.ascontiguousarray(green4d)
+    red    =  red4d.reshape(red4d.shape[0], -1)
+    flt    =  green[:5].astype(np.float32)
+    for k in range(flt.shape[0]):
+        flt[k]  =  gaussian_filter(flt[k], 1)
+    return green, red, flt
+
+
+if __name__ == "__main__":
+    rng    =  np.random.default_rng(0)
+    green  =  rng.integers(0, 4096, (30, 10, 256, 256), dtype=np.uint16)                      # 6 files of 5 frames, 10 z planes
+    red    =  rng.integers(0, 4096, (30, 10, 256, 256), dtype=np.uint16)
+
+    res  =  []
+    for name, transpose in [["rot90 view", False], ["transposed decode", True]]:
+        (g4d, r4d), p_load, t_load  =  traced(lambda: [decode(green, transpose), decode(red, transpose)])
+        if not transpose:
+            g4d, r4d  =  orient_rot90(g4d), orient_rot90(r4d)
+        out, p_down, t_down  =  traced(downstream, g4d, r4d)
+        res.append(out)
+        print("%-20s load peak %6.1f MB (%.2f s)   downstream peak %6.1f MB (%.2f s)   C-contiguous: %s" % (name, p_load, t_load, p_down, t_down, g4d.flags["C_CONTIGUOUS"]))
+        del g4d, r4d, out
+    print("same output: %s" % all(np.array_equal(a, b) for a, b in zip(*res)))
@@ -0,0 +1,6 @@
+"""Modules of the software are at the root of the repository: make them importable by the tests."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,104 @@
+"""LabelsRemap against the per-label loops it replaced."""
+
+import numpy as np
+import pytest
+
+import LabelsRemap
+
+
+DTYPES  =  [np.uint16, np.uint32, np.int32, np.int64, np.float64]
+
+
+def label_stack(dtype, shape=(6, 40, 50), n_tags=30, seed=0):
+    """Random stack of labels (tags 0..n_tags) of the given dtype."""
+    rng  =  np.random.default_rng(seed)
+    return rng.integers(0, n_tags + 1, shape).astype(dtype)
+
+
+def drop_loop(lbls, ids):
+    """Removal of the tags one by one, as RemoveBorderNuclei and BackgroundEstimateFillingGaps did."""
+    lbls  =  lbls.copy()
+    for k in ids:
+        lbls  *=  (1 - (lbls == k)).astype(bool)
+    return lbls
+
+
+def merge_loop(lbls, idxs):
+    """Join of the tags into the first one, as LabelsModify did."""
+    labels_mask  =  np.zeros(lbls.shape)
+    for l in idxs:
+        labels_mask  +=  (lbls == l).astype(np.int32)
+    return lbls * (1 - labels_mask) + idxs[0] * labels_mask
+
+
+def frames_loop(lbls):
+    """Number of frames of each tag, one tag at a time."""
+    tags    =  np.unique(lbls[lbls != 0])
+    counts  =  np.zeros(int(lbls.max(initial=0)) + 1, dtype=np.int64)
+    for k in tags:
+        counts[int(k)]  =  np.sum(np.sign(np.sum(lbls == k, axis=(1, 2))))
+    return counts
+
+
+@pytest.mark.parametrize("dtype", DTYPES)
+def test_identity(dtype):
+    lbls  =  label_stack(dtype)
+    res   =  LabelsRemap.remap(lbls, LabelsRemap.identity_lut(lbls.max(), dtype))
+    assert res.dtype == dtype
+    np.testing.assert_array_equal(res, lbls)
+
+
+@pytest.mark.parametrize("dtype", DTYPES)
+def test_drop(dtype):
+    lbls  =  label_stack(dtype)
+    ids   =  [3, 7, 8, 29]
+    res   =  LabelsRemap.remap(lbls, LabelsRemap.drop_lut(lbls.max(), ids, dtype))
+    assert res.dtype == dtype
+    np.testing.assert_array_equal(res, drop_loop(lbls, ids))
+
+
+@pytest.mark.parametrize("dtype", DTYPES)
+def test_drop_in_place(dtype):
+    lbls  =  label_stack(dtype)
+    ref   =  drop_loop(lbls, [1, 2, 5])
+    out   =  LabelsRemap.remap(lbls, LabelsRemap.drop_lut(lbls.max(), [1, 2, 5], dtype), out=lbls, chunk=4)
+    assert out is lbls
+    np.testing.assert_array_equal(lbls, ref)
+
+
+def test_drop_ids_above_max():
+    lbls  =  label_stack(np.uint16, n_tags=10)
+    lut   =  LabelsRemap.drop_lut(lbls.max(), [4, 11, 500], np.uint16)
+    assert lut.size == 11
+    np.testing.assert_array_equal(LabelsRemap.remap(lbls, lut), drop_loop(lbls, [4]))
+
+
+@pytest.mark.parametrize("dtype", DTYPES)
+def test_merge(dtype):
+    lbls    =  label_stack(dtype, shape=(40, 50))
+    groups  =  [[5, 2, 9], [12, 13]]
+    res     =  LabelsRemap.remap(lbls, LabelsRemap.merge_lut(lbls.max(), groups))
+    ref     =  merge_loop(merge_loop(lbls, np.array(groups[0])), np.array(groups[1]))
+    np.testing.assert_array_equal(res, ref)
+
+
+@pytest.mark.parametrize("chunk", [None, 1, 4, 100])
+def test_chunks(chunk):
+    lbls  =  label_stack(np.int32, shape=(9, 20, 30))
+    lut   =  LabelsRemap.drop_lut(lbls.max(), [1, 6], np.int32)
+    np.testing.assert_array_equal(LabelsRemap.remap(lbls, lut, chunk=chunk), drop_loop(lbls, [1, 6]))
+
+
+@pytest.mark.parametrize("dtype", DTYPES)
+def test_frames_count(dtype):
+    lbls  =  label_stack(dtype, n_tags=300)
+    cnts  =  LabelsRemap.frames_count(lbls)
+    ref   =  frames_loop(lbls)
+    np.testing.assert_array_equal(cnts[1:], ref[1:])
+
+
+def test_empty_stack():
+    lbls  =  np.zeros((0, 8, 8), dtype=np.uint16)
+    res   =  LabelsRemap.remap(lbls, LabelsRemap.drop_lut(lbls.max(initial=0), [1], np.uint16))
+    assert res.shape == (0, 8, 8)
+    np.testing.assert_array_equal(LabelsRemap.frames_count(lbls), [0])
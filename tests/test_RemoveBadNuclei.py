@@ -0,0 +1,42 @@
+"""RemoveBadNuclei against the loops it replaced."""
+
+import numpy as np
+import pytest
+from skimage.morphology import remove_small_objects
+
+import RemoveBadNuclei
+
+
+def nuclei_movie(tlen=6, size=80, seed=0):
+    """Movie of square nuclei of random size and tag."""
+    rng     =  np.random.default_rng(seed)
+    nuclei  =  np.zeros((tlen, size, size), dtype=np.int32)
+    for t in range(tlen):
+        for k in range(1, 25):
+            x0, y0, side                          =  rng.integers(0, size - 4), rng.integers(0, size - 4), rng.integers(2, 12)
+            nuclei[t, x0:x0 + side, y0:y0 + side]  =  k
+    return nuclei
+
+
+def small_loop(nuclei_tracked, area_thr):
+    """Removal of the small nuclei, one frame at a time."""
+    return np.array([remove_small_objects(frame, area_thr) for frame in nuclei_tracked])
+
+
+@pytest.mark.parametrize("n_workers", [1, 2, None])
+def test_small_nuclei_workers(n_workers):
+    nuclei  =  nuclei_movie()
+    res     =  RemoveBadNuclei.RemoveSmallNuclei(nuclei, 30, n_workers=n_workers).nuclei_thrd
+    np.testing.assert_array_equal(res, small_loop(nuclei, 30))
+
+
+@pytest.mark.parametrize("px_brd", [0, 3, 10])
+def test_border_nuclei(px_brd):
+    nuclei  =  nuclei_movie()
+    mask    =  np.ones(nuclei.shape, dtype=bool)                                   # border as the original code made it (with px_brd = 0 everything is border)
+    mask[:, px_brd:-px_brd, px_brd:-px_brd]  =  False
+    ref     =  nuclei.copy()
+    for k in np.unique(nuclei[mask & (nuclei > 0)]):
+        ref  *=  (1 - (ref == k)).astype(bool)
+    res     =  RemoveBadNuclei.RemoveBorderNuclei(nuclei.copy(), px_brd).nuclei_tracked
+    np.testing.assert_array_equal(res, ref)